@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, fk):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+def populate_counters(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    Follow = apps.get_model('accounts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    User.objects.update(
+        followers_count=_count(Follow, 'following'),
+        following_count=_count(Follow, 'follower'),
+        posts_count=_count(Post, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_profile_picture'),
+        ('posts', '0004_post_youtube_video_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
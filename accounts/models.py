@@ -1,6 +1,5 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from PIL import Image
 
 
 class User(AbstractUser):
@@ -18,35 +17,14 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized counters, kept in step by core.signals and repaired by reconcile_counters
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
+
     def __str__(self):
         return self.username
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-
-        if self.profile_picture and self.profile_picture.name != 'profile_pics/default.jpg':
-            try:
-                img = Image.open(self.profile_picture.path)
-                if img.height > 300 or img.width > 300:
-                    output_size = (300, 300)
-                    img.thumbnail(output_size)
-                    img.save(self.profile_picture.path)
-            except Exception:
-                # If there's an issue with the image, just continue
-                pass
-
-    @property
-    def followers_count(self):
-        return self.followers.count()
-
-    @property
-    def following_count(self):
-        return self.following.count()
-
-    @property
-    def posts_count(self):
-        return self.posts.count()
-
 
 class Follow(models.Model):
     follower = models.ForeignKey(
@@ -13,6 +13,7 @@ urlpatterns = [
     # Profile URLs
     path('profile/<str:username>/', views.profile, name='profile'),
     path('edit-profile/', views.edit_profile, name='edit_profile'),
+    path('search/', views.search_users, name='search'),
     
     # Follow URLs
     path('follow/', views.follow_user, name='follow'),
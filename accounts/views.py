@@ -5,10 +5,15 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth import get_user_model
-from django.core.paginator import Paginator
+from django.db import transaction
 from .forms import CustomUserCreationForm, UserProfileForm
 from .models import Follow
 from posts.models import Post
+from posts.serializers import serialize_author, serialize_post
+from posts.viewer_state import annotate_viewer_state
+from core import follow_graph, notifications, search
+from core.images import rendition_url
+from core.pagination import CursorPaginator, page_response, wants_json
 
 User = get_user_model()
 
@@ -70,30 +75,22 @@ def register(request):
 @login_required
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user, is_active=True)
-
-    # Add like and save status for each post
-    if request.user.is_authenticated:
-        for post in posts:
-            post.user_has_liked = post.is_liked_by(request.user)
-            post.user_has_saved = post.is_saved_by(request.user)
-    else:
-        for post in posts:
-            post.user_has_liked = False
-            post.user_has_saved = False
+    posts = Post.objects.filter(author=user, is_active=True).select_related('author')
 
     # Pagination
-    paginator = Paginator(posts, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, 12)
+    page = paginator.page(request.GET.get('cursor'))
+
+    # Add like and save status for the posts on this page
+    page.object_list = annotate_viewer_state(page.object_list, request.user)
+
+    if wants_json(request):
+        return page_response(page, serialize_post)
 
     # Check if current user follows this user
     is_following = False
     if request.user.is_authenticated and request.user != user:
-        is_following = Follow.objects.filter(
-            follower=request.user,
-            following=user
-        ).exists()
+        is_following = follow_graph.is_following(request.user.pk, user.pk)
 
     # Get activity data for own profile
     liked_posts = []
@@ -107,13 +104,13 @@ def profile(request, username):
         liked_posts = Post.objects.filter(
             likes__user=user,
             is_active=True
-        ).select_related('author').prefetch_related('likes', 'comments')[:20]
+        ).select_related('author')[:20]
 
         # Get saved posts
         saved_posts = Post.objects.filter(
             saves__user=user,
             is_active=True
-        ).select_related('author').prefetch_related('likes', 'comments')[:20]
+        ).select_related('author')[:20]
 
         # Get user's comments
         user_comments = Comment.objects.filter(
@@ -123,7 +120,7 @@ def profile(request, username):
 
     context = {
         'profile_user': user,
-        'posts': page_obj,
+        'posts': page,
         'is_following': is_following,
         'is_own_profile': request.user == user,
         'liked_posts': liked_posts,
@@ -155,12 +152,16 @@ def follow_user(request):
     if request.user == user_to_follow:
         return JsonResponse({'error': 'You cannot follow yourself'}, status=400)
     
-    follow, created = Follow.objects.get_or_create(
-        follower=request.user,
-        following=user_to_follow
-    )
-    
+    with transaction.atomic():
+        follow, created = Follow.objects.get_or_create(
+            follower=request.user,
+            following=user_to_follow
+        )
+
     if created:
+        notifications.notify(user_to_follow.pk, request.user.pk, 'follow', at=follow.created_at)
+
+        user_to_follow.refresh_from_db(fields=['followers_count'])
         return JsonResponse({
             'status': 'followed',
             'followers_count': user_to_follow.followers_count
@@ -176,11 +177,17 @@ def unfollow_user(request):
     user_to_unfollow = get_object_or_404(User, username=username)
     
     try:
-        follow = Follow.objects.get(
-            follower=request.user,
-            following=user_to_unfollow
-        )
-        follow.delete()
+        with transaction.atomic():
+            follow = Follow.objects.get(
+                follower=request.user,
+                following=user_to_unfollow
+            )
+            follow.delete()
+
+        # Take the follow back out of the notification that counted it
+        notifications.retract(user_to_unfollow.pk, request.user.pk, 'follow', at=follow.created_at)
+
+        user_to_unfollow.refresh_from_db(fields=['followers_count'])
         return JsonResponse({
             'status': 'unfollowed',
             'followers_count': user_to_unfollow.followers_count
@@ -194,13 +201,15 @@ def followers_list(request, username):
     user = get_object_or_404(User, username=username)
     followers = Follow.objects.filter(following=user).select_related('follower')
     
-    paginator = Paginator(followers, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    paginator = CursorPaginator(followers, 20)
+    page = paginator.page(request.GET.get('cursor'))
+
+    if wants_json(request):
+        return page_response(page, lambda follow: serialize_author(follow.follower))
+
     context = {
         'profile_user': user,
-        'followers': page_obj,
+        'followers': page,
         'list_type': 'followers'
     }
     return render(request, 'accounts/follow_list.html', context)
@@ -211,13 +220,40 @@ def following_list(request, username):
     user = get_object_or_404(User, username=username)
     following = Follow.objects.filter(follower=user).select_related('following')
     
-    paginator = Paginator(following, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    paginator = CursorPaginator(following, 20)
+    page = paginator.page(request.GET.get('cursor'))
+
+    if wants_json(request):
+        return page_response(page, lambda follow: serialize_author(follow.following))
+
     context = {
         'profile_user': user,
-        'following': page_obj,
+        'following': page,
         'list_type': 'following'
     }
     return render(request, 'accounts/follow_list.html', context)
+
+
+def search_users(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+
+    # Ranked ids from the full-text index (see core/search.py)
+    user_ids = [user_id for user_id, _ in search.search_users(query, limit=limit)] if query else []
+    users_by_id = User.objects.filter(id__in=user_ids, is_active=True).in_bulk()
+
+    results = []
+    for user_id in user_ids:
+        user = users_by_id.get(user_id)
+        if user:
+            results.append({
+                'username': user.username,
+                'full_name': user.get_full_name(),
+                'profile_picture': rendition_url(user.profile_picture, 'avatar_40'),
+                'is_verified': user.is_verified,
+                'followers_count': user.followers_count,
+            })
+    return JsonResponse({'query': query, 'results': results})
@@ -0,0 +1,76 @@
+"""
+System checks for settings that only work within a single process.
+
+The unread-count and follow-graph caches are invalidated by the process that
+commits a change; with a process-local backend every other server or worker
+process keeps serving its own copy until it expires. That is fine for a
+single ``runserver``, so core.W001 is a deployment check (``check --deploy``).
+
+Without ``JOBS_ALWAYS_EAGER``, notifications are recorded by ``run_workers``,
+which bumps unread counts and publishes pushes from its own process, and
+worker jobs such as ``suggestions.refresh`` read the follow graph while only
+web processes invalidate it. A process-local broker, unread cache or follow
+graph cache would then go stale or never reach the web processes, so
+core.E001 is an error.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+PROCESS_LOCAL_BROKERS = {
+    'core.realtime.InProcessBroker',
+}
+
+# setting -> (default alias, what the cache holds)
+SHARED_CACHES = {
+    'UNREAD_COUNTS_CACHE': ('default', 'unread counts'),
+    'FOLLOW_GRAPH_CACHE': ('default', 'follow graph'),
+}
+
+
+def is_process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_worker_delivery(app_configs, **kwargs):
+    if getattr(settings, 'JOBS_ALWAYS_EAGER', False):
+        return []
+    errors = []
+    broker = getattr(settings, 'REALTIME_BROKER', 'core.realtime.InProcessBroker')
+    if broker in PROCESS_LOCAL_BROKERS:
+        errors.append(Error(
+            f"REALTIME_BROKER = {broker!r} cannot deliver events published by run_workers.",
+            hint="Use 'core.realtime.DatabaseBroker' or another cross-process broker, or set JOBS_ALWAYS_EAGER.",
+            obj='REALTIME_BROKER',
+            id='core.E001',
+        ))
+    for setting, (default, purpose) in SHARED_CACHES.items():
+        alias = getattr(settings, setting, default)
+        if is_process_local(alias):
+            errors.append(Error(
+                f"The {purpose} cache ({setting} = {alias!r}) is process-local, so run_workers and the "
+                f"web processes each see their own copy.",
+                hint=f'Point {setting} at a shared cache (Redis, Memcached, DatabaseCache), or set JOBS_ALWAYS_EAGER.',
+                obj=setting,
+                id='core.E001',
+            ))
+    return errors
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    warnings = []
+    for setting, (default, purpose) in SHARED_CACHES.items():
+        alias = getattr(settings, setting, default)
+        if is_process_local(alias):
+            warnings.append(Warning(
+                f"The {purpose} cache ({setting} = {alias!r}) uses a process-local backend.",
+                hint='Point it at a cache shared by every process, such as Redis or Memcached.',
+                obj=setting,
+                id='core.W001',
+            ))
+    return warnings
@@ -0,0 +1,125 @@
+"""
+Direct message conversations.
+
+Every pair of users shares one Conversation, found by its ``key`` (the two
+user ids, lower first). Each participant has a ConversationMember row: it
+holds their unread count and a copy of the conversation's last activity
+time. The inbox is therefore a single keyset scan of the user's member rows
+over ``core_inbox_idx`` (user, last activity), and a thread is a keyset scan
+of ``core_message_thread_idx`` (conversation, created_at). Neither scans
+all of a user's messages.
+
+``send`` writes the message and updates the thread summary in one
+transaction: the last message pointer, both members' activity times and
+the recipient's unread count. The counters use F() expressions and the
+pointer only moves forward, so concurrent sends cannot lose updates.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q
+from django.db.models.functions import Greatest
+
+from .models import Conversation, ConversationMember, Message
+from .pagination import CursorPaginator
+from . import unread
+
+INBOX_ORDERING = ('-last_message_at', '-id')
+THREAD_ORDERING = ('-created_at', '-id')
+
+
+def key_for(user_id, other_id):
+    low, high = sorted((user_id, other_id))
+    return f'{low}:{high}'
+
+
+def between(user_id, other_id):
+    """The conversation of two users, created with both members on first use"""
+    conversation, created = Conversation.objects.get_or_create(key=key_for(user_id, other_id))
+    if created:
+        ConversationMember.objects.bulk_create(
+            [ConversationMember(conversation=conversation, user_id=member_id) for member_id in {user_id, other_id}],
+            ignore_conflicts=True,
+        )
+    return conversation
+
+
+def send(sender, recipient, content):
+    """Create a message and update its conversation's summary atomically"""
+    with transaction.atomic():
+        conversation = between(sender.pk, recipient.pk)
+        message = Message.objects.create(
+            conversation=conversation,
+            sender=sender,
+            recipient=recipient,
+            content=content,
+        )
+        at = message.created_at
+
+        # A message that commits after a newer one must not become the last message
+        Conversation.objects.filter(pk=conversation.pk).filter(
+            Q(last_message__isnull=True) | Q(last_message_at__lte=at)
+        ).update(last_message=message, last_message_at=at)
+        ConversationMember.objects.filter(conversation=conversation, last_message_at__lt=at).update(
+            last_message_at=at
+        )
+        if recipient.pk != sender.pk:
+            ConversationMember.objects.filter(conversation=conversation, user=recipient).update(
+                unread_count=F('unread_count') + 1
+            )
+    return message
+
+
+def membership(user, conversation_id):
+    """``user``'s member row of a conversation, or None if they are not in it"""
+    return ConversationMember.objects.filter(user=user, conversation_id=conversation_id).select_related(
+        'conversation'
+    ).first()
+
+
+def inbox_page(user, cursor=None, per_page=20):
+    """A page of ``user``'s conversations, most recently active first"""
+    members = ConversationMember.objects.filter(user=user).select_related(
+        'conversation__last_message__sender'
+    ).prefetch_related(
+        Prefetch(
+            'conversation__members',
+            queryset=ConversationMember.objects.select_related('user'),
+            to_attr='participants',
+        )
+    )
+    page = CursorPaginator(members, per_page, ordering=INBOX_ORDERING).page(cursor)
+    for member in page:
+        # The other participant (or the user themselves in a note-to-self thread)
+        others = [m.user for m in member.conversation.participants if m.user_id != user.pk]
+        member.other = others[0] if others else user
+    return page
+
+
+def thread_page(conversation, cursor=None, per_page=30):
+    """A page of a conversation's messages, newest first"""
+    messages = Message.objects.filter(conversation=conversation).select_related('sender')
+    return CursorPaginator(messages, per_page, ordering=THREAD_ORDERING).page(cursor)
+
+
+def mark_read(user, up_to=None, conversation_id=None):
+    """
+    Mark messages to ``user`` read, up to message id ``up_to`` when given and
+    in one conversation when given, and lower the members' unread counts to
+    match; returns how many messages were marked.
+    """
+    scope = {'conversation_id': conversation_id} if conversation_id is not None else {}
+    unread_rows = Message.objects.filter(recipient=user, is_read=False, **scope)
+    if up_to is not None:
+        unread_rows = unread_rows.filter(id__lte=up_to)
+
+    with transaction.atomic():
+        # Per conversation, so each member row drops by what was read in it
+        by_conversation = dict(
+            unread_rows.order_by().values_list('conversation_id').annotate(n=Count('id'))
+        )
+        marked = unread.mark_read(user.pk, unread.MESSAGES, up_to, **scope)
+        for read_conversation_id, read in by_conversation.items():
+            # Messages that arrive meanwhile stay counted
+            ConversationMember.objects.filter(conversation_id=read_conversation_id, user=user).update(
+                unread_count=Greatest(F('unread_count') - read, 0)
+            )
+    return marked
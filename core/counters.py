@@ -0,0 +1,97 @@
+"""
+Denormalized engagement counters.
+
+Counter columns on Post, Comment and User are adjusted with F() expressions
+by the signal handlers in core.signals, inside the same transaction as the
+Like/Save/Share/Comment/Follow write that changed them. ``reconcile`` repairs
+any drift in bulk and backs the reconcile_counters command.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from accounts.models import Follow
+from posts.models import Post, Like, Comment, Save, Share
+from posts.comments import below
+
+User = get_user_model()
+
+
+def _actual_descendants():
+    # The same path range as posts.comments.descendants, for every comment at once
+    rows = Comment.objects.filter(
+        post_id=OuterRef('post_id'), is_active=True, **below(OuterRef('path'))
+    ).order_by().values('post_id').annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+# (model, counter field, counted model, foreign key on counted model, extra filters);
+# counters not kept per foreign key give a function building the recount instead of a model
+COUNTERS = [
+    (Post, 'likes_count', Like, 'post', {}),
+    (Post, 'comments_count', Comment, 'post', {}),
+    (Post, 'saves_count', Save, 'post', {}),
+    (Post, 'shares_count', Share, 'post', {}),
+    (Comment, 'replies_count', Comment, 'parent', {'is_active': True}),
+    (Comment, 'descendants_count', _actual_descendants, None, {}),
+    (User, 'followers_count', Follow, 'following', {}),
+    (User, 'following_count', Follow, 'follower', {}),
+    (User, 'posts_count', Post, 'author', {}),
+]
+
+
+def adjust(model, pk, delta, *fields):
+    """Atomically add ``delta`` to counter columns of one row, never going below zero"""
+    model.objects.filter(pk=pk).update(**{
+        field: Greatest(F(field) + delta, Value(0)) for field in fields
+    })
+
+
+def _actual_count(counted, fk, filters):
+    rows = counted.objects.filter(
+        **{fk: OuterRef('pk')}, **filters
+    ).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+def reconcile(model, batch_size=1000, dry_run=False):
+    """
+    Recount every counter column of ``model`` in primary-key chunks.
+
+    Each chunk is one annotated SELECT plus one bulk UPDATE of the rows that
+    drifted. Returns the number of rows that were (or would be) repaired.
+    """
+    specs = [(field, counted, fk, filters) for m, field, counted, fk, filters in COUNTERS if m is model]
+    fields = [field for field, *_ in specs]
+    annotations = {
+        f'actual_{field}': counted() if fk is None else _actual_count(counted, fk, filters)
+        for field, counted, fk, filters in specs
+    }
+
+    repaired = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', *fields)
+            .annotate(**annotations)[:batch_size]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1].pk
+
+        drifted = []
+        for row in rows:
+            changed = False
+            for field in fields:
+                actual = getattr(row, f'actual_{field}')
+                if getattr(row, field) != actual:
+                    setattr(row, field, actual)
+                    changed = True
+            if changed:
+                drifted.append(row)
+
+        if drifted and not dry_run:
+            model.objects.bulk_update(drifted, fields)
+        repaired += len(drifted)
+    return repaired
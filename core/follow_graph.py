@@ -0,0 +1,161 @@
+"""
+Cached follow graph.
+
+Each user's adjacency lists (the ids they follow, and the ids following
+them) are kept in the ``FOLLOW_GRAPH_CACHE`` cache alias as sorted integer
+arrays packed with ``array``: four bytes per id (eight once ids outgrow 32
+bits) instead of a pickled set, so even large follower lists stay small in
+a shared cache. Lists missing from the cache are loaded for many users with
+one query and stored together.
+
+* ``is_following`` is a binary search of one cached array, without a query;
+* ``following_state`` answers "which of these authors does the viewer
+  follow" for a whole page from the viewer's single array;
+* ``mutual_ids`` (people who follow each other with a user) and
+  ``common_following`` are intersections of cached arrays.
+
+Every user has a cache version that is part of their lists' keys. The
+Follow signal handlers in core.signals replace both users' versions once the
+follow or unfollow commits, so the next read misses and reloads the lists
+from the committed rows. Moving to a new key rather than deleting the old
+one also covers a reader that loaded the rows before the commit and stores
+them after it: the stale list lands under the retired version and is never
+read. Versions have no timeout; the lists expire with the cache's (short)
+TIMEOUT. The cache must be shared by every process (checks core.W001 and
+core.E001).
+"""
+import uuid
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+
+from accounts.models import Follow
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+
+# direction -> (column holding the user, column holding their neighbours)
+COLUMNS = {
+    FOLLOWING: ('follower_id', 'following_id'),
+    FOLLOWERS: ('following_id', 'follower_id'),
+}
+
+
+def _cache():
+    return caches[getattr(settings, 'FOLLOW_GRAPH_CACHE', 'default')]
+
+
+def _version_key(user_id):
+    return f'follow-graph:version:{user_id}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _versions(cache, user_ids):
+    """``{user_id: version}``, starting a fresh version for users without one"""
+    keys = {user_id: _version_key(user_id) for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    versions = {}
+    for user_id, key in keys.items():
+        if key not in cached:
+            # Never reuse a version: lists stored under an evicted one may be stale
+            cache.add(key, _new_version(), timeout=None)
+            cached[key] = cache.get(key)
+        versions[user_id] = cached[key]
+    return versions
+
+
+def _key(direction, user_id, version):
+    return f'follow-graph:{direction}:{user_id}:{version}'
+
+
+def pack(ids):
+    """Sorted ids as a compact ``array``"""
+    ids = sorted(ids)
+    return array('I' if not ids or ids[-1] < 2 ** 32 else 'Q', ids)
+
+
+def _encode(ids):
+    return ids.typecode, ids.tobytes()
+
+
+def _decode(value):
+    typecode, raw = value
+    ids = array(typecode)
+    ids.frombytes(raw)
+    return ids
+
+
+def adjacency(direction, user_ids):
+    """``{user_id: sorted array of neighbour ids}`` for ``user_ids`` in one direction"""
+    cache = _cache()
+    versions = _versions(cache, set(user_ids))
+    keys = {user_id: _key(direction, user_id, version) for user_id, version in versions.items()}
+    cached = cache.get_many(keys.values())
+
+    lists = {}
+    missing = []
+    for user_id, key in keys.items():
+        if key in cached:
+            lists[user_id] = _decode(cached[key])
+        else:
+            missing.append(user_id)
+
+    if missing:
+        own, other = COLUMNS[direction]
+        loaded = {user_id: [] for user_id in missing}
+        for user_id, neighbour_id in Follow.objects.filter(**{f'{own}__in': missing}).values_list(own, other):
+            loaded[user_id].append(neighbour_id)
+        packed = {user_id: pack(ids) for user_id, ids in loaded.items()}
+        cache.set_many({keys[user_id]: _encode(ids) for user_id, ids in packed.items()})
+        lists.update(packed)
+    return lists
+
+
+def following_ids(user_id):
+    return adjacency(FOLLOWING, [user_id])[user_id]
+
+
+def follower_ids(user_id):
+    return adjacency(FOLLOWERS, [user_id])[user_id]
+
+
+def contains(ids, user_id):
+    """Membership in a sorted id array by binary search"""
+    index = bisect_left(ids, user_id)
+    return index < len(ids) and ids[index] == user_id
+
+
+def is_following(follower_id, following_id):
+    return contains(following_ids(follower_id), following_id)
+
+
+def following_state(viewer, author_ids):
+    """The subset of ``author_ids`` that ``viewer`` follows"""
+    if not viewer.is_authenticated:
+        return set()
+    author_ids = set(author_ids)
+    author_ids.discard(viewer.pk)
+    if not author_ids:
+        return set()
+    return author_ids.intersection(following_ids(viewer.pk))
+
+
+def mutual_ids(user_id):
+    """Users who follow ``user_id`` and are followed back"""
+    return set(following_ids(user_id)).intersection(follower_ids(user_id))
+
+
+def common_following(user_id, other_id):
+    """Users both ``user_id`` and ``other_id`` follow"""
+    lists = adjacency(FOLLOWING, [user_id, other_id])
+    return set(lists[user_id]).intersection(lists[other_id])
+
+
+def invalidate(*user_ids):
+    """Retire both adjacency lists of ``user_ids``; the next read reloads them"""
+    _cache().set_many({_version_key(user_id): _new_version() for user_id in user_ids}, timeout=None)
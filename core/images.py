@@ -0,0 +1,320 @@
+"""
+Image renditions for post images, story images and profile pictures.
+
+When a Post or Story image or a User profile picture changes, core.signals queues an
+``images.render`` job. The job, run by the job workers (see core/jobs.py),
+decodes the upload once, applies its EXIF orientation, drops all metadata
+(EXIF, GPS, XMP, ICC) and writes one file per (size, format) pair:
+
+* post images: ``feed`` (fits 1080x1350) and ``thumbnail`` (320px square)
+* story images: ``story`` (fits 1080x1920)
+* profile pictures: ``avatar_40``, ``avatar_150`` and ``avatar_300`` (square)
+
+in each of ``IMAGE_RENDITION_FORMATS`` that the installed Pillow can encode,
+best first. Every file is recorded as an ImageRendition row; renditions of
+an owner's previous upload are deleted. The original file is never rewritten.
+
+Templates pick a size with the ``rendition`` filter (core/templatetags/media.py)
+and JSON responses with ``rendition_url``; both read the rendition map from
+the cache and fall back to the original file until the job has run.
+
+Responsive images
+-----------------
+The ``responsive_image`` template tag renders an image of a ``FAMILIES``
+entry with a ``srcset`` per format over the family's widths, so browsers
+download the smallest file that covers the slot. Widths that match a
+pre-rendered kind use its file; the others point at the
+``core:responsive_image`` view, which resizes the original on first request
+and keeps the result on disk under ``IMAGE_CACHE_ROOT``, keyed by
+(content hash of the original, family and width, format). Identical uploads
+share their variants, and the cache directory can be cleared at any time.
+Variant URLs carry a signed source name so only stored uploads can be
+resized, and only to the family's widths.
+"""
+import hashlib
+import os
+import threading
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image, ImageOps, features
+
+from posts.models import Post
+from .models import ImageRendition, Story
+
+User = get_user_model()
+
+# kind -> (width, height, crop to fill); uncropped kinds keep their aspect ratio and never upscale
+SPECS = {
+    'feed': (1080, 1350, False),
+    'thumbnail': (320, 320, True),
+    'story': (1080, 1920, False),
+    'avatar_40': (40, 40, True),
+    'avatar_150': (150, 150, True),
+    'avatar_300': (300, 300, True),
+}
+
+# owner type -> (model, image field, rendition kinds)
+OWNERS = {
+    'post': (Post, 'image', ['feed', 'thumbnail']),
+    'story': (Story, 'image', ['story']),
+    'user': (User, 'profile_picture', ['avatar_40', 'avatar_150', 'avatar_300']),
+}
+
+# format -> (Pillow format, Pillow feature, file extension, encoder options)
+ENCODERS = {
+    'avif': ('AVIF', 'avif', 'avif', {'quality': 60}),
+    'webp': ('WEBP', 'webp', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', None, 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Responsive family -> (crop to fill, height/width of the bounding box, srcset
+# widths, pre-rendered kinds covering some of those widths, smallest first)
+FAMILIES = {
+    'avatar': (True, 1, [40, 80, 150, 300], ['avatar_40', 'avatar_150', 'avatar_300']),
+    'thumbnail': (True, 1, [160, 320, 640], ['thumbnail']),
+    'feed': (False, 1.25, [480, 720, 1080], ['feed']),
+    'story': (False, 16 / 9, [540, 1080], ['story']),
+}
+
+# Placeholder some accounts were created with; not worth rendering
+DEFAULT_PICTURES = {'profile_pics/default.jpg'}
+
+CACHE_TIMEOUT = 24 * 3600
+MISSING_CACHE_TIMEOUT = 60
+
+VARIANT_SALT = 'core.images.variant'
+
+
+def formats():
+    """Configured formats this Pillow build can encode, best first"""
+    configured = getattr(settings, 'IMAGE_RENDITION_FORMATS', ['webp', 'jpeg'])
+    return [
+        name for name in configured
+        if name in ENCODERS and (ENCODERS[name][1] is None or features.check(ENCODERS[name][1]))
+    ]
+
+
+def wants_renditions(name):
+    return bool(name) and name not in DEFAULT_PICTURES
+
+
+def cache_root():
+    return Path(getattr(settings, 'IMAGE_CACHE_ROOT', Path(settings.MEDIA_ROOT) / 'cache'))
+
+
+def _cache_key(source):
+    return 'renditions:' + hashlib.md5(source.encode()).hexdigest()
+
+
+def _hash_key(source):
+    return 'image-hash:' + hashlib.md5(source.encode()).hexdigest()
+
+
+def _open(source):
+    """Decode a stored upload upright and without any of its metadata"""
+    with default_storage.open(source) as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+        # Nothing from the upload's metadata is carried into the renditions
+        image.info = {}
+    return image
+
+
+def _resize(image, kind):
+    return _fit(image, *SPECS[kind])
+
+
+def _fit(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.LANCZOS)
+    return resized
+
+
+def _encode(image, name):
+    pillow_format, _, _, options = ENCODERS[name]
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha; flatten onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def render(owner_type, owner_id):
+    """Create the renditions of an owner's current image; returns how many files were written"""
+    model, field, kinds = OWNERS[owner_type]
+    owner = model.objects.filter(pk=owner_id).only(field).first()
+    source = getattr(owner, field).name if owner is not None else ''
+    if not wants_renditions(source):
+        prune(owner_type, owner_id)
+        return 0
+
+    wanted = {(kind, name) for kind in kinds for name in formats()}
+    existing = set(ImageRendition.objects.filter(source=source).values_list('kind', 'format'))
+    if wanted <= existing:
+        return 0
+
+    # A reused storage name may now hold different content
+    cache.delete(_hash_key(source))
+    try:
+        image = _open(source)
+    except FileNotFoundError:
+        # A dangling reference (see manage.py fix_profile_pictures); nothing to render
+        prune(owner_type, owner_id)
+        return 0
+
+    stem = PurePosixPath(source).stem
+    written = []
+    for kind in kinds:
+        resized = _resize(image, kind)
+        for name in formats():
+            if (kind, name) in existing:
+                continue
+            path = f'renditions/{owner_type}/{owner_id}/{stem}-{kind}.{ENCODERS[name][2]}'
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            path = default_storage.save(path, ContentFile(_encode(resized, name)))
+            written.append(ImageRendition(
+                owner_type=owner_type,
+                owner_id=owner_id,
+                source=source,
+                kind=kind,
+                format=name,
+                file=path,
+                width=resized.width,
+                height=resized.height,
+            ))
+
+    with transaction.atomic():
+        ImageRendition.objects.bulk_create(written, ignore_conflicts=True)
+        prune(owner_type, owner_id, keep=source)
+    cache.delete(_cache_key(source))
+    return len(written)
+
+
+def prune(owner_type, owner_id, keep=None):
+    """Delete an owner's renditions (and files) other than those of ``keep``"""
+    stale = ImageRendition.objects.filter(owner_type=owner_type, owner_id=owner_id).exclude(source=keep or '')
+    for rendition in stale:
+        rendition.file.delete(save=False)
+        cache.delete(_cache_key(rendition.source))
+    stale.delete()
+
+
+def renditions_for(source):
+    """``{kind: [{'format', 'url', 'width', 'height'}, ...]}`` for a source file, best format first"""
+    key = _cache_key(source)
+    renditions = cache.get(key)
+    if renditions is None:
+        rows = ImageRendition.objects.filter(source=source).values_list('kind', 'format', 'file', 'width', 'height')
+        order = {name: index for index, name in enumerate(formats())}
+        renditions = {}
+        for kind, name, path, width, height in sorted(rows, key=lambda row: order.get(row[1], len(order))):
+            renditions.setdefault(kind, []).append({
+                'format': name,
+                'url': default_storage.url(path),
+                'width': width,
+                'height': height,
+            })
+        # Images still waiting for their job are looked up again soon
+        cache.set(key, renditions, CACHE_TIMEOUT if renditions else MISSING_CACHE_TIMEOUT)
+    return renditions
+
+
+def rendition_url(image, kind):
+    """URL of an image's ``kind`` rendition in the best format, or of the original until it exists"""
+    if not image:
+        return None
+    options = renditions_for(image.name).get(kind)
+    if options:
+        return options[0]['url']
+    return image.url
+
+
+def source_hash(source):
+    """SHA-256 of a stored upload, cached by storage name"""
+    key = _hash_key(source)
+    digest = cache.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with default_storage.open(source) as original:
+            for chunk in original.chunks():
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        cache.set(key, digest, CACHE_TIMEOUT)
+    return digest
+
+
+def variant_path(source, family, width, name):
+    """Disk cache location of ``source`` resized for ``family`` at ``width`` in format ``name``"""
+    digest = source_hash(source)
+    return cache_root() / digest[:2] / digest / f'{family}-{width}.{ENCODERS[name][2]}'
+
+
+def variant(source, family, width, name):
+    """Path of a cached variant, generating it on first use"""
+    path = variant_path(source, family, width, name)
+    if not path.exists():
+        crop, ratio, _, _ = FAMILIES[family]
+        data = _encode(_fit(_open(source), width, round(width * ratio), crop), name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent first requests each write their own file; the rename is atomic
+        partial = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}')
+        partial.write_bytes(data)
+        os.replace(partial, path)
+    return path
+
+
+def variant_url(source, family, width, name):
+    token = Signer(salt=VARIANT_SALT).sign_object(source)
+    return reverse('core:responsive_image', args=[token, family, width, name])
+
+
+def unsign_variant(token):
+    """Storage name in a variant URL token; raises ``django.core.signing.BadSignature``"""
+    return Signer(salt=VARIANT_SALT).unsign_object(token)
+
+
+def responsive_sources(image, family):
+    """
+    ``([(format, [(url, width), ...]), ...], (width, height) or None)`` for
+    an image's ``family`` widths in every format, best format first.
+
+    The size is that of the family's largest pre-rendered kind, for the
+    <img> width/height attributes, once it exists. Uncropped images
+    narrower than a width are not offered at that width.
+    """
+    crop, _, widths, kinds = FAMILIES[family]
+    rendered = renditions_for(image.name)
+    by_width = {SPECS[kind][0]: kind for kind in kinds}
+
+    largest = rendered.get(kinds[-1])
+    size = (largest[0]['width'], largest[0]['height']) if largest else None
+    limit = size[0] if size and not crop else None
+
+    sources = []
+    for name in formats():
+        candidates = []
+        for width in widths:
+            kind = by_width.get(width)
+            match = [r for r in rendered.get(kind, []) if r['format'] == name]
+            if match:
+                candidates.append((match[0]['url'], match[0]['width']))
+            elif limit is None or width < limit:
+                candidates.append((variant_url(image.name, family, width, name), width))
+        sources.append((name, candidates))
+    return sources, size
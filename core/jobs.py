@@ -0,0 +1,235 @@
+"""
+Database-backed background jobs.
+
+Write endpoints enqueue their side effects (notifications, trending refresh,
+timeline fan-out, image processing) instead of running them inside the
+request. ``enqueue`` inserts a Job row in the caller's transaction, so a job
+becomes visible to workers exactly when the write that caused it commits and
+disappears with it on rollback.
+
+``manage.py run_workers`` claims due jobs in batches and runs them on a pool
+of threads. Jobs of the same task in one batch are handed to the task
+together when it was registered with ``batch=True``, so a burst of likes on a
+post becomes one notification UPDATE and one trending refresh. Failures are
+retried with exponential backoff up to ``max_attempts``; jobs left running
+by a dead worker are released after ``JOBS_LOCK_TIMEOUT_SECONDS``.
+
+A job is marked done in the same transaction as its handler's writes, and
+only while the worker still holds its lock. Either both commit or neither
+does, so a crash in between or a lock released as stale never leaves the
+handler's work committed for a job that will run again.
+
+An ``idempotency_key`` makes ``enqueue`` a no-op while a job with the same key
+exists (finished jobs are kept for ``JOBS_RETENTION_HOURS``). A job that fails
+for good gives its key up, so the same work can be queued again.
+
+With ``JOBS_ALWAYS_EAGER`` (the default when DEBUG is on) jobs skip the table
+and run in-process right after the transaction commits, so development does
+not need a worker running.
+"""
+import logging
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Task name -> (function, takes a list of payloads)
+TASKS = {}
+
+
+def task(name, batch=False):
+    """
+    Register a job handler.
+
+    Single handlers are called as ``func(**payload)``; batch handlers as
+    ``func(payloads)`` with every claimed payload of that task at once.
+    """
+    def register(func):
+        TASKS[name] = (func, batch)
+        return func
+    return register
+
+
+def always_eager():
+    return getattr(settings, 'JOBS_ALWAYS_EAGER', False)
+
+
+def lock_timeout():
+    return timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT_SECONDS', 300))
+
+
+def retention():
+    return timedelta(hours=getattr(settings, 'JOBS_RETENTION_HOURS', 24))
+
+
+def backoff(attempts):
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF_SECONDS', 5)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def enqueue(name, payload=None, key=None, delay=None, max_attempts=5):
+    """Queue ``name`` to run with ``payload`` once the current transaction commits"""
+    payload = payload or {}
+    if always_eager():
+        transaction.on_commit(lambda: run_eagerly(name, payload))
+        return
+
+    Job.objects.bulk_create([
+        Job(
+            name=name,
+            payload=payload,
+            idempotency_key=key,
+            run_at=timezone.now() + (delay or timedelta()),
+            max_attempts=max_attempts,
+        )
+    ], ignore_conflicts=key is not None)
+
+
+class LockLost(Exception):
+    """The worker's lock on a job was released (see ``release_stale``) before it finished"""
+
+
+def run_eagerly(name, payload):
+    try:
+        _call(name, [payload])
+    except Exception:
+        logger.exception('Job %s failed', name)
+
+
+def _call(name, payloads, finish=None):
+    """Run a task on ``payloads``, then ``finish()``, all in one transaction"""
+    func, batch = TASKS[name]
+    with transaction.atomic():
+        if batch:
+            func(payloads)
+        else:
+            for payload in payloads:
+                func(**payload)
+        if finish is not None:
+            finish()
+
+
+def _finisher(jobs):
+    """Mark ``jobs`` done, raising LockLost (rolling the handler back) if another worker may have them"""
+    def finish():
+        finished = Job.objects.filter(
+            pk__in=[job.pk for job in jobs],
+            status=RUNNING,
+            locked_by=jobs[0].locked_by,
+        ).update(status=DONE, finished_at=timezone.now(), locked_by='')
+        if finished != len(jobs):
+            raise LockLost
+    return finish
+
+
+def claim(worker_id, limit):
+    """Lock up to ``limit`` due jobs for ``worker_id`` and return them"""
+    now = timezone.now()
+    ids = list(
+        Job.objects.filter(status=QUEUED, run_at__lte=now)
+        .order_by('run_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    # The status check makes the claim safe against other workers racing for the same rows
+    Job.objects.filter(id__in=ids, status=QUEUED).update(
+        status=RUNNING,
+        locked_by=worker_id,
+        locked_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return list(Job.objects.filter(id__in=ids, status=RUNNING, locked_by=worker_id))
+
+
+def process(jobs):
+    """Run claimed jobs, batching jobs of the same task; returns the number that succeeded"""
+    by_name = defaultdict(list)
+    for job in jobs:
+        by_name[job.name].append(job)
+
+    succeeded = 0
+    for name, group in by_name.items():
+        if name not in TASKS:
+            _failed(group, f'Unknown job {name}', retry=False)
+            continue
+
+        # Batch handlers get the whole group; a failure retries all of it
+        _, batch = TASKS[name]
+        for chunk in ([group] if batch else [[job] for job in group]):
+            try:
+                _call(name, [job.payload for job in chunk], finish=_finisher(chunk))
+            except LockLost:
+                # Requeued as stale while running; the handler's writes were rolled back
+                logger.warning('Lost the lock on %s job(s) %s', name, [job.pk for job in chunk])
+            except Exception:
+                _failed(chunk, traceback.format_exc())
+            else:
+                succeeded += len(chunk)
+    return succeeded
+
+
+def _failed(jobs, error, retry=True):
+    now = timezone.now()
+    for job in jobs:
+        if retry and job.attempts < job.max_attempts:
+            logger.warning('Job %s (%s) failed, retrying: %s', job.pk, job.name, error)
+            fields = {'status': QUEUED, 'run_at': now + backoff(job.attempts)}
+        else:
+            logger.error('Job %s (%s) failed permanently: %s', job.pk, job.name, error)
+            fields = {'status': FAILED, 'finished_at': now, 'idempotency_key': None}
+        Job.objects.filter(pk=job.pk).update(locked_by='', last_error=error, **fields)
+
+
+def release_stale():
+    """Requeue jobs whose worker stopped without finishing them; returns how many"""
+    cutoff = timezone.now() - lock_timeout()
+    stale = Job.objects.filter(status=RUNNING, locked_at__lt=cutoff)
+    released = stale.filter(attempts__lt=F('max_attempts')).update(status=QUEUED, locked_by='')
+    released += stale.update(
+        status=FAILED,
+        locked_by='',
+        finished_at=timezone.now(),
+        last_error='Worker lock expired',
+        idempotency_key=None,
+    )
+    return released
+
+
+def purge():
+    """Delete finished jobs past the retention period"""
+    deleted, _ = Job.objects.filter(status=DONE, finished_at__lt=timezone.now() - retention()).delete()
+    return deleted
+
+
+def metrics():
+    """Queue depth and health, for the worker log and /api/jobs/metrics/"""
+    now = timezone.now()
+    by_status = dict(Job.objects.order_by().values_list('status').annotate(n=Count('id')))
+    by_name = dict(
+        Job.objects.filter(status=QUEUED).order_by().values_list('name').annotate(n=Count('id'))
+    )
+    oldest = Job.objects.filter(status=QUEUED, run_at__lte=now).order_by('run_at').values_list(
+        'run_at', flat=True
+    ).first()
+    return {
+        'depth': by_status.get(QUEUED, 0),
+        'running': by_status.get(RUNNING, 0),
+        'failed': by_status.get(FAILED, 0),
+        'depth_by_job': by_name,
+        'oldest_due_seconds': (now - oldest).total_seconds() if oldest else 0,
+    }
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from core.timeline import rebuild_timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines from the follow graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the timeline of this username')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users loaded per batch')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True).order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f'User "{options["user"]}" does not exist')
+
+        users_done = 0
+        entries_written = 0
+        last_id = 0
+        while True:
+            batch = list(users.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+
+            for user in batch:
+                with transaction.atomic():
+                    entries_written += rebuild_timeline(user)
+                users_done += 1
+            last_id = batch[-1].id
+            self.stdout.write(f'Rebuilt {users_done} timelines...')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt {users_done} timelines ({entries_written} entries)')
+        )
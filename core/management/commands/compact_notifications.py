@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.notifications import compact
+
+
+class Command(BaseCommand):
+    help = 'Merge existing per-event notifications into coalesced rows (see core/notifications.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Recipients processed per chunk')
+        parser.add_argument('--dry-run', action='store_true', help='Report how many rows would be removed without changing anything')
+
+    def handle(self, *args, **options):
+        removed = compact(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{removed} notifications would be merged away'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully compacted notifications, removing {removed} rows'))
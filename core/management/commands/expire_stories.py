@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.stories import sweep
+
+
+class Command(BaseCommand):
+    help = 'Deactivate expired stories, or delete them and their media with --delete (see core/stories.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Stories handled per transaction')
+        parser.add_argument('--delete', action='store_true', help='Delete expired stories and their media files')
+
+    def handle(self, *args, **options):
+        swept = sweep(batch_size=options['batch_size'], delete=options['delete'])
+        action = 'deleted' if options['delete'] else 'deactivated'
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully {action} {swept} expired stories'
+        ))
@@ -1,33 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-import os
+from core import profile_pictures
 
 User = get_user_model()
 
 
 class Command(BaseCommand):
-    help = 'Fix profile picture issues by clearing invalid profile picture references'
+    help = (
+        'Fix profile picture issues by clearing invalid profile picture references, '
+        'and refresh the profile picture index (see core/profile_pictures.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Files checked in parallel')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users read per query')
+        parser.add_argument(
+            '--index-only',
+            action='store_true',
+            help='Only refresh the index; leave references to missing files in place',
+        )
 
     def handle(self, *args, **options):
         users_fixed = 0
-        
-        for user in User.objects.all():
-            if user.profile_picture:
-                # Check if the file actually exists
-                try:
-                    if not user.profile_picture.file:
-                        # File doesn't exist, clear the field
-                        user.profile_picture = None
-                        user.save()
-                        users_fixed += 1
-                        self.stdout.write(f'Fixed profile picture for user: {user.username}')
-                except (ValueError, FileNotFoundError):
-                    # File doesn't exist or is invalid, clear the field
-                    user.profile_picture = None
-                    user.save()
-                    users_fixed += 1
-                    self.stdout.write(f'Fixed profile picture for user: {user.username}')
-        
+        checked = 0
+
+        rows = (
+            User.objects.exclude(profile_picture='')
+            .exclude(profile_picture__isnull=True)
+            .order_by('pk')
+            .values_list('pk', 'username', 'profile_picture')
+        )
+        # Storage checks are I/O bound (a stat locally, a request on remote storage)
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            batch = []
+            for row in rows.iterator(chunk_size=options['batch_size']):
+                batch.append(row)
+                if len(batch) == options['batch_size']:
+                    users_fixed += self.check_batch(executor, batch, options['index_only'])
+                    checked += len(batch)
+                    batch = []
+            if batch:
+                users_fixed += self.check_batch(executor, batch, options['index_only'])
+                checked += len(batch)
+
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully fixed {users_fixed} profile pictures')
+            self.style.SUCCESS(f'Successfully checked {checked} and fixed {users_fixed} profile pictures')
         )
+
+    def check_batch(self, executor, batch, index_only):
+        names = [name for _, _, name in batch]
+        results = dict(zip(names, executor.map(profile_pictures.check, names)))
+        profile_pictures.record(results)
+        if index_only:
+            return 0
+
+        fixed = 0
+        for user_id, username, name in batch:
+            if results[name]:
+                continue
+            # File doesn't exist, clear the field; saving also drops its renditions
+            user = User.objects.get(pk=user_id)
+            user.profile_picture = None
+            user.save(update_fields=['profile_picture'])
+            fixed += 1
+            self.stdout.write(f'Fixed profile picture for user: {username}')
+        return fixed
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from core.images import OWNERS, wants_renditions
+from core.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Queue image rendition jobs for existing post and story images and profile pictures (see core/images.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows read per query')
+
+    def handle(self, *args, **options):
+        queued = 0
+        for owner_type, (model, field, _) in OWNERS.items():
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list('pk', field)
+            for owner_id, name in rows.iterator(chunk_size=options['batch_size']):
+                if wants_renditions(name):
+                    # Same key as the upload signal, so images already queued are skipped
+                    enqueue('images.render', {'owner_type': owner_type, 'owner_id': owner_id}, key=f'images.render:{name}')
+                    queued += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully queued renditions for {queued} images'
+        ))
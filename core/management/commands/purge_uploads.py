@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from posts.uploads import purge_abandoned
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked video uploads abandoned for VIDEO_UPLOAD_EXPIRY_HOURS (see posts/uploads.py)'
+
+    def handle(self, *args, **options):
+        purged = purge_abandoned()
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully purged {purged} abandoned uploads'
+        ))
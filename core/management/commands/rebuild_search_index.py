@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.search import PythonIndexBackend, get_backend, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for posts and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows loaded per query')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if isinstance(backend, PythonIndexBackend):
+            self.stdout.write(self.style.WARNING(
+                'The in-process fallback index is built lazily and refreshed by each server process; '
+                'this only checks that it builds.'
+            ))
+        with transaction.atomic():
+            indexed = rebuild(backend, batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {indexed} documents ({type(backend).__name__})')
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.trending import recompute_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored trending scores (run periodically, and after changing TRENDING_* settings)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts updated per query')
+
+    def handle(self, *args, **options):
+        updated = recompute_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully recomputed trending scores for {updated} posts'))
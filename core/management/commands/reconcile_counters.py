@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from posts.models import Post, Comment
+from core.counters import reconcile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized like/comment/save/share/follow/post counters and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows recounted per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (Post, Comment, User):
+            repaired = reconcile(model, batch_size=options['batch_size'], dry_run=options['dry_run'])
+            total += repaired
+            self.stdout.write(f'{model._meta.verbose_name_plural.title()}: {repaired} rows with drift')
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} rows with counter drift'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from core.suggestions import refresh
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute "people you may know" follow suggestions for every active user (see core/suggestions.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users scored together')
+
+    def handle(self, *args, **options):
+        users = 0
+        stored = 0
+        batch = []
+        user_ids = User.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True)
+        for user_id in user_ids.iterator(chunk_size=options['batch_size']):
+            batch.append(user_id)
+            if len(batch) == options['batch_size']:
+                stored += refresh(batch)
+                users += len(batch)
+                batch = []
+        if batch:
+            stored += refresh(batch)
+            users += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully stored {stored} suggestions for {users} users'
+        ))
@@ -0,0 +1,67 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs (see core/jobs.py) on a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads')
+        parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per batch')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--metrics-interval', type=float, default=60.0, help='Seconds between queue depth reports')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+        jobs.release_stale()
+        threads = [
+            threading.Thread(target=self.work, args=(f'{socket.gethostname()}:{os.getpid()}:{n}', stop, options))
+            for n in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f'Started {len(threads)} job workers'))
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                # Housekeeping and the queue depth metric, between worker batches
+                self.report(jobs.metrics())
+                jobs.release_stale()
+                jobs.purge()
+                for thread in threads:
+                    thread.join(options['metrics_interval'] / len(threads))
+        except KeyboardInterrupt:
+            stop.set()
+        for thread in threads:
+            thread.join()
+        connection.close()
+        self.stdout.write(self.style.SUCCESS('Job workers stopped'))
+
+    def work(self, worker_id, stop, options):
+        try:
+            while not stop.is_set():
+                claimed = jobs.claim(worker_id, options['batch_size'])
+                if claimed:
+                    jobs.process(claimed)
+                elif options['once']:
+                    break
+                else:
+                    stop.wait(options['poll_interval'])
+        finally:
+            connection.close()
+
+    def report(self, metrics):
+        self.stdout.write(
+            f"{time.strftime('%H:%M:%S')} queue depth {metrics['depth']}, running {metrics['running']}, "
+            f"failed {metrics['failed']}, oldest due {metrics['oldest_due_seconds']:.0f}s"
+        )
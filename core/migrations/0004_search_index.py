@@ -0,0 +1,70 @@
+import re
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Frozen copies of the document format in core.search as of this migration, so
+# later changes to that module cannot change what this migration does
+FTS_TABLE = 'core_search_index'
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+
+def _rowid(doc_type, doc_id):
+    # Posts and users share one table, so interleave their ids
+    return doc_id * 2 + (1 if doc_type == 'user' else 0)
+
+
+def _author_text(user):
+    return ' '.join(filter(None, [user.username, user.first_name, user.last_name]))
+
+
+def _user_row(user):
+    return [_rowid('user', user.pk), 'user', user.pk, user.bio, '', '', _author_text(user)]
+
+
+def _post_row(post):
+    hashtags = ' '.join(HASHTAG_RE.findall(f'{post.content} {post.caption}'))
+    return [_rowid('post', post.pk), 'post', post.pk, post.content, post.caption, hashtags, _author_text(post.author)]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return  # Other databases use the in-process fallback index
+
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "doc_type UNINDEXED, doc_id UNINDEXED, content, caption, hashtags, author, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        return  # SQLite built without FTS5
+
+    User = apps.get_model('accounts', 'User')
+    Post = apps.get_model('posts', 'Post')
+    rows = [_user_row(user) for user in User.objects.filter(is_active=True)]
+    rows += [_post_row(post) for post in Post.objects.filter(is_active=True).select_related('author')]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, doc_type, doc_id, content, caption, hashtags, author) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            rows
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_timelineentry'),
+        ('accounts', '0003_user_counters'),
+        ('posts', '0006_trending_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
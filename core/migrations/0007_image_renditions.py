@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_type', models.CharField(choices=[('post', 'Post image'), ('user', 'Profile picture')], max_length=10)),
+                ('owner_id', models.PositiveBigIntegerField()),
+                ('source', models.CharField(max_length=255)),
+                ('kind', models.CharField(max_length=20)),
+                ('format', models.CharField(max_length=10)),
+                ('file', models.FileField(upload_to='renditions/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_type', 'owner_id'], name='core_rendition_owner_idx')],
+                'unique_together': {('source', 'kind', 'format')},
+            },
+        ),
+    ]
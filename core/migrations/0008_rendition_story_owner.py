@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagerendition',
+            name='owner_type',
+            field=models.CharField(choices=[('post', 'Post image'), ('story', 'Story image'), ('user', 'Profile picture')], max_length=10),
+        ),
+    ]
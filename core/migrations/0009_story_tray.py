@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:03
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_rendition_story_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorySeen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_seen_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='story',
+            name='expires_at',
+            field=models.DateTimeField(default=core.models.story_expiry),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['author', 'expires_at'], name='core_story_tray_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['expires_at'], name='core_story_expiry_idx'),
+        ),
+        migrations.AddField(
+            model_name='storyseen',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='storyseen',
+            name='viewer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='storyseen',
+            unique_together={('viewer', 'author')},
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def create_conversations(apps, schema_editor):
+    # One conversation per pair of users who have exchanged messages
+    Message = apps.get_model('core', 'Message')
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationMember = apps.get_model('core', 'ConversationMember')
+
+    pairs = {tuple(sorted(pair)) for pair in Message.objects.values_list('sender_id', 'recipient_id').distinct()}
+    for low, high in sorted(pairs):
+        thread = Message.objects.filter(
+            Q(sender_id=low, recipient_id=high) | Q(sender_id=high, recipient_id=low)
+        )
+        last = thread.order_by('-created_at', '-id').first()
+        conversation = Conversation.objects.create(
+            key=f'{low}:{high}', last_message=last, last_message_at=last.created_at
+        )
+        thread.update(conversation=conversation)
+        ConversationMember.objects.bulk_create([
+            ConversationMember(
+                conversation=conversation,
+                user_id=user_id,
+                last_message_at=last.created_at,
+                unread_count=thread.filter(recipient_id=user_id, is_read=False).count(),
+            )
+            for user_id in {low, high}
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_story_tray'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('last_message_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='core.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='core_message_thread_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='core.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='conversationmember',
+            index=models.Index(fields=['user', '-last_message_at', '-id'], name='core_inbox_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationmember',
+            unique_together={('conversation', 'user')},
+        ),
+        migrations.RunPython(create_conversations, migrations.RunPython.noop),
+    ]
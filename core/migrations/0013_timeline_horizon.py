@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_counters'),
+        ('core', '0012_follow_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineHorizon',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('created_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,5 +1,10 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -12,22 +17,81 @@ class Notification(models.Model):
         ('share', 'Share'),
     ]
 
+    VERBS = {
+        'like': 'liked your post',
+        'comment': 'commented on your post',
+        'follow': 'started following you',
+        'share': 'shared your post',
+    }
+
+    # One row aggregates every event of the same type on the same post within
+    # the coalescing window (see core/notifications.py); sender is the latest actor
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_notifications')
     notification_type = models.CharField(max_length=10, choices=NOTIFICATION_TYPES)
     message = models.CharField(max_length=255)
     post = models.ForeignKey('posts.Post', on_delete=models.CASCADE, null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)  # First event of the group
+    updated_at = models.DateTimeField(default=timezone.now)  # Latest event of the group
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at', '-id']
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='core_notif_feed_idx'),
+            models.Index(fields=['recipient', 'notification_type', 'post', '-created_at'], name='core_notif_group_idx'),
+            # Only unread rows: unread counts and mark-read stay cheap however long the history is
+            models.Index(fields=['recipient', 'id'], name='core_notif_unread_idx', condition=models.Q(is_read=False)),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} {self.notification_type} - {self.recipient.username}"
 
+    @property
+    def summary(self):
+        """'alice liked your post' / 'alice and 41 others liked your post'"""
+        verb = self.VERBS.get(self.notification_type)
+        if verb is None:
+            return self.message
+        others = self.actor_count - 1
+        if others <= 0:
+            return f"{self.sender.username} {verb}"
+        return f"{self.sender.username} and {others} other{'s' if others > 1 else ''} {verb}"
+
+
+class Conversation(models.Model):
+    """A direct message thread between two users (see core/conversations.py)."""
+    key = models.CharField(max_length=50, unique=True)  # "<lower user id>:<higher user id>"
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Conversation {self.key}"
+
+
+class ConversationMember(models.Model):
+    """A user's side of a conversation: their inbox row and unread count."""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(default=timezone.now)  # Copied from the conversation for the inbox index
+
+    class Meta:
+        unique_together = ('conversation', 'user')
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='core_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} in {self.conversation.key}"
+
 
 class Message(models.Model):
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name='messages'
+    )
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField(max_length=1000)
@@ -36,11 +100,23 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['conversation', '-created_at', '-id'], name='core_message_thread_idx'),
+            models.Index(
+                fields=['recipient', 'conversation', 'id'],
+                name='core_message_unread_idx',
+                condition=models.Q(is_read=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender.username} to {self.recipient.username}"
 
 
+def story_expiry():
+    return timezone.now() + timedelta(hours=getattr(settings, 'STORY_LIFETIME_HOURS', 24))
+
+
 class Story(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stories')
     content = models.TextField(max_length=500, blank=True)
@@ -48,16 +124,164 @@ class Story(models.Model):
     video = models.FileField(upload_to='story_videos/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()  # Stories expire after 24 hours
+    expires_at = models.DateTimeField(default=story_expiry)  # Stories expire after 24 hours
 
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Stories'
+        indexes = [
+            # The story tray: live stories of a set of authors (see core/stories.py)
+            models.Index(
+                fields=['author', 'expires_at'],
+                name='core_story_tray_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # The expiry sweeper
+            models.Index(fields=['expires_at'], name='core_story_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"Story by {self.author.username}"
 
     @property
     def is_expired(self):
-        from django.utils import timezone
         return timezone.now() > self.expires_at
+
+
+class StorySeen(models.Model):
+    """How far a viewer has watched an author's stories: every story up to ``last_seen_id``."""
+    viewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_seen_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('viewer', 'author')
+
+    def __str__(self):
+        return f"{self.viewer.username} saw {self.author.username}'s stories up to {self.last_seen_id}"
+
+
+class TimelineEntry(models.Model):
+    """A post materialized into one user's home timeline (fan-out-on-write)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey('posts.Post', on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()  # Copied from the post so the feed can be read by keyset
+
+    class Meta:
+        ordering = ['-created_at', '-post']
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='core_timeline_feed_idx'),
+            models.Index(fields=['user', 'author'], name='core_timeline_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.user_id}'s timeline"
+
+
+class TimelineHorizon(models.Model):
+    """
+    How far back a user's materialized timeline is complete: posts created at
+    or before ``created_at`` may be missing from it and are read by query.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id}'s timeline is complete after {self.created_at}"
+
+
+class RealtimeEvent(models.Model):
+    """An event published through DatabaseBroker, picked up by every server process (see core/realtime.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Event {self.pk} for {self.user_id}"
+
+
+class FollowSuggestion(models.Model):
+    """A precomputed "people you may know" candidate for a user (see core/suggestions.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)  # People the user follows who follow the candidate
+    follows_user = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score', 'candidate'], name='core_suggestion_idx'),
+        ]
+
+    def __str__(self):
+        return f"Suggest {self.candidate_id} to {self.user_id} ({self.score:.2f})"
+
+
+class Job(models.Model):
+    """A queued side effect, run by the run_workers command (see core/jobs.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            models.Index(
+                fields=['run_at', 'id'],
+                name='core_job_queued_idx',
+                condition=models.Q(status='queued')
+            ),
+            models.Index(fields=['status', 'finished_at'], name='core_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} job {self.id} ({self.status})"
+
+
+class ImageRendition(models.Model):
+    """A resized, re-encoded copy of an uploaded image (see core/images.py)."""
+    OWNER_TYPES = [
+        ('post', 'Post image'),
+        ('story', 'Story image'),
+        ('user', 'Profile picture'),
+    ]
+
+    owner_type = models.CharField(max_length=10, choices=OWNER_TYPES)
+    owner_id = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=255)  # Storage name of the original upload
+    kind = models.CharField(max_length=20)  # e.g. feed, thumbnail, avatar_40
+    format = models.CharField(max_length=10)
+    file = models.FileField(upload_to='renditions/')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source', 'kind', 'format')
+        indexes = [
+            models.Index(fields=['owner_type', 'owner_id'], name='core_rendition_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.format} of {self.source}"
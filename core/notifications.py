@@ -0,0 +1,267 @@
+"""
+Coalesced notifications.
+
+Instead of one Notification row per like/comment/follow, events are grouped
+by (recipient, type, post) into one row per ``NOTIFICATION_COALESCE_WINDOW_HOURS``
+window ("alice and 41 others liked your post"). A new event joins the
+group's unread row, which is updated in place: the latest actor becomes the
+sender and ``actor_count`` goes up. Once the group is read or its window has
+passed, the next event starts a new row, so a recipient gets at most one row
+per post and type per window however popular the post is.
+
+``notify`` queues an event as a background job; ``record`` takes a batch of
+queued events and writes them with one SELECT for the open groups, one bulk
+INSERT for new groups, and per touched group one SELECT for which of the
+batch's actors it already counts plus one UPDATE. ``actor_count`` is exact:
+someone acting again after others have is not counted twice. ``retract`` undoes an event (unlike, unfollow) using the time it
+happened to find the group it was counted in.
+
+Existing rows can be merged into the same shape with ``manage.py compact_notifications``.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from accounts.models import Follow
+from posts.models import Comment, Like, Share
+from .models import Notification
+from . import jobs, realtime, unread
+
+User = get_user_model()
+
+Event = namedtuple('Event', ['recipient_id', 'sender_id', 'notification_type', 'post_id', 'at'])
+
+# Where an event's like/follow lives: (model, actor field, filter selecting the
+# events of a group; works on both Notification rows and Events)
+ACTOR_SOURCES = {
+    'like': (Like, 'user_id', lambda group: {'post_id': group.post_id}),
+    'follow': (Follow, 'follower_id', lambda group: {'following_id': group.recipient_id}),
+}
+
+# Every type's source, for finding the actors a group already counts
+EVENT_SOURCES = {
+    **ACTOR_SOURCES,
+    'comment': (Comment, 'author_id', lambda group: {'post_id': group.post_id}),
+    'share': (Share, 'user_id', lambda group: {'post_id': group.post_id}),
+}
+
+
+def window():
+    return timedelta(hours=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW_HOURS', 24))
+
+
+def message(username, notification_type):
+    return f"{username} {Notification.VERBS[notification_type]}"
+
+
+def notify(recipient_id, sender_id, notification_type, post_id=None, at=None):
+    """Queue a single event; workers ``record`` queued events in batches (see core.tasks)"""
+    if recipient_id == sender_id:
+        return
+    at = (at or timezone.now()).isoformat()
+    jobs.enqueue('notifications.record', {
+        'recipient_id': recipient_id,
+        'sender_id': sender_id,
+        'notification_type': notification_type,
+        'post_id': post_id,
+        'at': at,
+    }, key=f'notifications.record:{recipient_id}:{sender_id}:{notification_type}:{post_id}:{at}')
+
+
+def still_current(events):
+    """Drop like/follow events whose like or follow has since been removed"""
+    current = []
+    for event in events:
+        source = ACTOR_SOURCES.get(event.notification_type)
+        if source is not None:
+            model, actor_field, scope = source
+            if not model.objects.filter(**scope(event), **{actor_field: event.sender_id}).exists():
+                continue
+        current.append(event)
+    return current
+
+
+def _open_groups(keys, since):
+    """Latest unread group per (recipient, type, post) key started after ``since``"""
+    condition = Q()
+    for recipient_id, notification_type, post_id in keys:
+        condition |= Q(recipient_id=recipient_id, notification_type=notification_type, post_id=post_id)
+
+    groups = {}
+    for group in Notification.objects.filter(condition, is_read=False, created_at__gte=since).order_by('created_at'):
+        groups[(group.recipient_id, group.notification_type, group.post_id)] = group
+    return groups
+
+
+def counted_actors(group, sender_ids):
+    """Which of ``sender_ids`` already acted within ``group``, and so are in its ``actor_count``"""
+    counted = {group.sender_id}
+    source = EVENT_SOURCES.get(group.notification_type)
+    if source is not None:
+        model, actor_field, scope = source
+        counted.update(model.objects.filter(
+            **scope(group),
+            **{f'{actor_field}__in': sender_ids},
+            created_at__gte=group.created_at,
+            created_at__lte=group.updated_at,
+        ).values_list(actor_field, flat=True))
+    return counted
+
+
+def record(events):
+    """Coalesce a batch of events into their notification groups"""
+    events = sorted((event for event in events if event.recipient_id != event.sender_id), key=lambda e: e.at)
+    if not events:
+        return
+
+    by_key = defaultdict(list)
+    for event in events:
+        by_key[(event.recipient_id, event.notification_type, event.post_id)].append(event)
+
+    usernames = dict(User.objects.filter(pk__in={e.sender_id for e in events}).values_list('id', 'username'))
+    groups = _open_groups(by_key, events[0].at - window())
+
+    created = []
+    updated = []
+    with transaction.atomic():
+        for key, key_events in by_key.items():
+            group = groups.get(key)
+            latest = key_events[-1]
+            if group is not None and group.created_at < key_events[0].at - window():
+                group = None
+
+            # Count each actor once, also when they acted earlier in the group
+            # (e.g. someone commenting again after others did)
+            senders = {e.sender_id for e in key_events}
+            if group is not None:
+                senders -= counted_actors(group, senders)
+            added = len(senders)
+
+            fields = {
+                'sender_id': latest.sender_id,
+                'message': message(usernames.get(latest.sender_id, ''), latest.notification_type),
+                'updated_at': latest.at,
+            }
+            if group is None:
+                created.append(Notification(
+                    recipient_id=key[0],
+                    notification_type=key[1],
+                    post_id=key[2],
+                    actor_count=max(added, 1),
+                    created_at=key_events[0].at,
+                    **fields
+                ))
+            else:
+                Notification.objects.filter(pk=group.pk).update(actor_count=F('actor_count') + added, **fields)
+                updated.append(group.pk)
+
+        created = Notification.objects.bulk_create(created)
+
+    transaction.on_commit(lambda: announce(created, updated))
+
+
+def announce(created, updated_ids=()):
+    """Bump unread counts for new rows and push new and updated rows to their recipients"""
+    for notification in created:
+        unread.increment(notification.recipient_id, unread.NOTIFICATIONS)
+
+    # bulk_create does not send post_save, so new rows are pushed here as well
+    rows = Notification.objects.filter(
+        pk__in=[n.pk for n in created] + list(updated_ids)
+    ).select_related('sender')
+    for notification in rows:
+        realtime.publish_notification(notification)
+
+
+def retract(recipient_id, sender_id, notification_type, post_id=None, at=None):
+    """Remove ``sender_id``'s event that happened at ``at`` from the group that counted it"""
+    group = Notification.objects.filter(
+        recipient_id=recipient_id,
+        notification_type=notification_type,
+        post_id=post_id,
+        created_at__lte=at,
+        updated_at__gte=at,
+    ).order_by('-created_at').first()
+    if group is None:
+        return
+
+    if group.actor_count <= 1:
+        group.delete()
+        return
+
+    group.actor_count -= 1
+    update_fields = ['actor_count']
+    source = ACTOR_SOURCES.get(notification_type)
+    if group.sender_id == sender_id and source is not None:
+        # Show the latest remaining actor of the group instead
+        model, actor_field, scope = source
+        remaining = model.objects.filter(
+            **scope(group),
+            created_at__gte=group.created_at,
+            created_at__lte=group.updated_at,
+        ).exclude(**{actor_field: sender_id}).order_by('-created_at').values_list(actor_field, 'created_at').first()
+        if remaining is not None:
+            actor_id, group.updated_at = remaining
+            group.sender_id = actor_id
+            group.message = message(User.objects.get(pk=actor_id).username, notification_type)
+            update_fields += ['sender', 'message', 'updated_at']
+    group.save(update_fields=update_fields)
+
+
+def compact(batch_size=500, dry_run=False):
+    """
+    Merge existing rows into coalesced groups, in chunks of recipients.
+
+    Rows with the same recipient, type, post and read state whose first
+    events fall within one window become a single row: the most recent one is
+    kept with the group's first and latest times and its actor count, and the
+    rest are deleted. Returns the number of rows that were (or would be) removed.
+    """
+    span = window()
+    removed = 0
+    last_recipient = 0
+    while True:
+        recipient_ids = list(
+            Notification.objects.filter(recipient_id__gt=last_recipient)
+            .order_by('recipient_id')
+            .values_list('recipient_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not recipient_ids:
+            break
+        last_recipient = recipient_ids[-1]
+
+        rows = Notification.objects.filter(recipient_id__in=recipient_ids).order_by(
+            'recipient_id', 'notification_type', 'post_id', 'is_read', 'created_at', 'id'
+        )
+        groups = []
+        for row in rows:
+            key = (row.recipient_id, row.notification_type, row.post_id, row.is_read)
+            if groups and groups[-1][0] == key and row.created_at <= groups[-1][1][0].created_at + span:
+                groups[-1][1].append(row)
+            else:
+                groups.append((key, [row]))
+
+        kept = []
+        deleted = []
+        for _, group in groups:
+            if len(group) < 2:
+                continue
+            latest = max(group, key=lambda row: (row.updated_at, row.pk))
+            # Rows already coalesced carry more actors than their sender
+            latest.actor_count = len({row.sender_id for row in group}) + sum(row.actor_count - 1 for row in group)
+            latest.created_at = group[0].created_at
+            kept.append(latest)
+            deleted.extend(row.pk for row in group if row is not latest)
+
+        if deleted and not dry_run:
+            with transaction.atomic():
+                Notification.objects.bulk_update(kept, ['actor_count', 'created_at'])
+                Notification.objects.filter(pk__in=deleted).delete()
+        removed += len(deleted)
+    return removed
@@ -0,0 +1,171 @@
+"""
+Cursor (keyset) pagination.
+
+Pages are addressed by an opaque cursor holding the ordering values of the
+last row on the previous page, so fetching any page is one indexed
+``WHERE (ordering) < (cursor) ORDER BY ... LIMIT per_page + 1`` query: no
+``COUNT(*)`` and no ``OFFSET`` scan, and rows inserted at the head of the
+list while someone scrolls never shift the pages they have not seen yet.
+
+The ordering must end in a unique field (normally ``-id``) so that every
+position is distinct.
+
+Orderings on a value that changes (such as an ``updated_at`` bumped by new
+activity) pass ``snapshot=<that field>``: the first page records the time it
+was read in the cursor and every later page leaves out rows changed after
+it, so a row moving above the cursor mid-scroll is neither skipped nor shown
+twice. It shows up at the top on the next fresh load instead.
+"""
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts datetimes to milliseconds; a cursor needs the exact value
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """Encode a list of ordering values as an opaque URL-safe token"""
+    raw = json.dumps(list(values), cls=CursorEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size=None):
+    """Decode a cursor token into its raw values, or None if missing/malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or (size is not None and len(values) != size):
+        return None
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the Q object selecting rows strictly after ``values`` in ``ordering``.
+
+    For ``('-created_at', '-id')`` and ``(t, 5)`` this is
+    ``created_at < t OR (created_at = t AND id < 5)``.
+    """
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+class CursorPage:
+    """One page of results plus the cursor of the page after it"""
+
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = list(object_list)
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class CursorPaginator:
+    """Keyset paginator for a queryset ordered by ``ordering``"""
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), snapshot=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.snapshot = snapshot
+
+    def _field_path(self, field):
+        # Follow "post__created_at" style lookups to the model field
+        model = self.queryset.model
+        parts = field.lstrip('-').split('__')
+        for part in parts[:-1]:
+            model = model._meta.get_field(part).related_model
+        return model._meta.get_field(parts[-1])
+
+    def _fields(self):
+        return self.ordering + ((self.snapshot,) if self.snapshot else ())
+
+    def _position(self, token):
+        fields = self._fields()
+        values = decode_cursor(token, size=len(fields))
+        if values is None:
+            return None
+        try:
+            return [self._field_path(field).to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            return None
+
+    def _values(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for part in field.lstrip('-').split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        position = self._position(cursor)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, position))
+
+        as_of = None
+        if self.snapshot:
+            as_of = position[-1] if position is not None else timezone.now()
+            queryset = queryset.filter(**{f'{self.snapshot}__lte': as_of})
+
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            values = self._values(rows[-1])
+            if self.snapshot:
+                values.append(as_of)
+            next_cursor = encode_cursor(values)
+        return CursorPage(rows, next_cursor)
+
+
+def wants_json(request):
+    """True when a listing view should answer with JSON (infinite scroll)"""
+    return request.GET.get('format') == 'json'
+
+
+def page_response(page, serialize, **extra):
+    """JSON response for a CursorPage, serializing each row with ``serialize``"""
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page],
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+        **extra,
+    })
@@ -0,0 +1,60 @@
+"""
+Cached "does this profile picture exist" index.
+
+Templates used to open ``user.profile_picture.file`` to check that an avatar
+was still on disk, one filesystem open per avatar per page. The index keeps
+the answer per storage name in the default cache instead: the URL when the
+file exists, an empty string when it does not. Entries are written when a
+picture is uploaded (core.signals), looked up and stored on a miss, and
+rewritten by ``manage.py fix_profile_pictures``, which stats every picture
+in parallel. Run it periodically with ``--index-only`` to catch files removed
+outside the app.
+
+Storage names are never reused for different content while the index
+matters (a changed picture gets a new name), so a changed picture simply
+misses the index and the old name's entry expires unused.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+TIMEOUT = 7 * 24 * 3600
+
+
+def _key(name):
+    return 'profile-picture:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def check(name):
+    """Stat ``name`` in storage and return its URL, or '' when the file is missing"""
+    try:
+        return default_storage.url(name) if default_storage.exists(name) else ''
+    except (ValueError, OSError):
+        return ''
+
+
+def url(picture):
+    """URL of a profile picture field file, or '' when it is empty or missing from storage"""
+    if not picture:
+        return ''
+    key = _key(picture.name)
+    cached = cache.get(key)
+    if cached is None:
+        cached = check(picture.name)
+        cache.set(key, cached, TIMEOUT)
+    return cached
+
+
+def remember(name):
+    """Record a picture that was just stored"""
+    cache.set(_key(name), default_storage.url(name), TIMEOUT)
+
+
+def record(results):
+    """Store ``{name: url or ''}`` from a scan"""
+    cache.set_many({_key(name): found for name, found in results.items()}, TIMEOUT)
+
+
+def forget(name):
+    cache.delete(_key(name))
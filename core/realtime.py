@@ -0,0 +1,237 @@
+"""
+Server push of unread counts and new notifications/messages.
+
+Pages subscribe to ``/api/events/``, a Server-Sent Events stream served by
+the ASGI application (social_media/asgi.py). Each open stream is a
+subscription on the configured broker; the Notification/Message signal
+handlers in core.signals publish an event to the recipient once the write
+commits, so an idle tab costs one parked coroutine instead of a pair of
+authenticated requests every 30 seconds. Counts come from core.unread.
+
+Brokers are pluggable through ``REALTIME_BROKER``. ``InProcessBroker`` only
+reaches streams held open by the same process. ``DatabaseBroker`` writes
+events to the RealtimeEvent table instead; every process with open streams
+polls it every ``REALTIME_POLL_SECONDS`` (one query for all of its streams)
+and hands the events to its own subscribers, so notifications recorded by
+``run_workers`` reach the web processes. It is the default when jobs are not
+eager (check core.E001). A shared channel such as Redis pub/sub can be
+plugged in the same way by implementing ``BaseBroker``.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import unread
+from .models import RealtimeEvent
+from .serializers import serialize_message, serialize_notification
+
+QUEUE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+def keepalive_seconds():
+    return getattr(settings, 'REALTIME_KEEPALIVE_SECONDS', 25)
+
+
+def poll_seconds():
+    return getattr(settings, 'REALTIME_POLL_SECONDS', 1)
+
+
+def event_retention():
+    return timedelta(seconds=getattr(settings, 'REALTIME_EVENT_RETENTION_SECONDS', 300))
+
+
+class BaseBroker:
+    """Pub/sub interface: every event published for a user reaches all of their subscriptions"""
+
+    def subscribe(self, user_id):
+        """Return a subscription with ``async get(timeout)`` and ``close()``; call from the event loop"""
+        raise NotImplementedError
+
+    def publish(self, user_id, event):
+        """Deliver ``event`` (a JSON-serializable dict) to ``user_id``; callable from any thread"""
+        raise NotImplementedError
+
+
+class Subscription:
+    """One open stream: an asyncio queue fed from whichever thread publishes"""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def _offer(self, event):
+        # A client this far behind will catch up from the counts in later events
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._offer, event)
+        except RuntimeError:
+            # The stream's event loop has shut down
+            self.close()
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker(BaseBroker):
+    """Broker for a single server process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)  # user id -> open subscriptions
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+class DatabaseBroker(InProcessBroker):
+    """Broker for several processes, relaying events through the RealtimeEvent table"""
+
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='realtime-listener', daemon=True)
+                self.listener.start()
+        return subscription
+
+    def publish(self, user_id, event):
+        RealtimeEvent.objects.create(user_id=user_id, payload=event)
+
+    def latest_id(self):
+        return RealtimeEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def poll(self, last_id):
+        """Deliver events after ``last_id`` to this process's subscribers; return the new position"""
+        ceiling = self.latest_id()
+        with self.lock:
+            user_ids = list(self.subscriptions)
+        if ceiling > last_id and user_ids:
+            events = RealtimeEvent.objects.filter(
+                id__gt=last_id,
+                id__lte=ceiling,
+                user_id__in=user_ids,
+            ).order_by('id').values_list('user_id', 'payload')
+            for user_id, event in events:
+                super().publish(user_id, event)
+        return max(ceiling, last_id)
+
+    def purge(self):
+        RealtimeEvent.objects.filter(created_at__lt=timezone.now() - event_retention()).delete()
+
+    def listen(self):
+        """Poll for events for as long as the process runs, starting from the latest one"""
+        last_id = None
+        last_purge = 0
+        while True:
+            try:
+                close_old_connections()
+                if last_id is None:
+                    last_id = self.latest_id()
+                else:
+                    last_id = self.poll(last_id)
+                if time.monotonic() - last_purge > event_retention().total_seconds():
+                    self.purge()
+                    last_purge = time.monotonic()
+            except DatabaseError:
+                logger.exception('Polling realtime events failed')
+            time.sleep(poll_seconds())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'REALTIME_BROKER', 'core.realtime.InProcessBroker'))()
+    return _broker
+
+
+def publish_counts(user_id):
+    get_broker().publish(user_id, {'type': 'counts', 'counts': unread.get_counts(user_id)})
+
+
+def publish_notification(notification):
+    get_broker().publish(notification.recipient_id, {
+        'type': 'notification',
+        'notification': serialize_notification(notification),
+        'counts': unread.get_counts(notification.recipient_id),
+    })
+
+
+def publish_message(message):
+    get_broker().publish(message.recipient_id, {
+        'type': 'message',
+        'message': serialize_message(message),
+        'counts': unread.get_counts(message.recipient_id),
+    })
+
+
+def format_event(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder)
+    return f'event: {event["type"]}\ndata: {data}\n\n'
+
+
+async def stream(user_id):
+    """Server-Sent Events for one user: current counts, then every published event"""
+    subscription = get_broker().subscribe(user_id)
+    try:
+        counts = await sync_to_async(unread.get_counts)(user_id)
+        yield format_event({'type': 'counts', 'counts': counts})
+        while True:
+            try:
+                event = await subscription.get(keepalive_seconds())
+            except asyncio.TimeoutError:
+                # Comment line, keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        subscription.close()
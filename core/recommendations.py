@@ -0,0 +1,309 @@
+"""
+Personalized ranking for the reels feed.
+
+Ranking is split into three cached stages so a request only does a top-K
+merge over precomputed data:
+
+* The candidate pool: the most recent ``REELS_CANDIDATE_POOL`` active reels
+  with their author and weighted engagement, shared by every viewer. It is
+  rebuilt when a reel is created or removed (see core.signals).
+* A per-user affinity vector: ``{author_id: weight}`` from the viewer's likes,
+  saves and shares of reels, plus the set of reels they already engaged with.
+  It is dropped whenever that user likes, saves, shares or follows.
+* A per-user ranking: the top ``REELS_RANKING_SIZE`` candidates scored by
+
+      follow * followed + affinity * log(1 + author affinity)
+      + popularity * log(1 + engagement) + freshness * 2 ** (-age / half_life)
+      - seen * already engaged
+
+  cached for ``REELS_RANKING_TTL`` seconds, or until the pool or the viewer's
+  affinity changes.
+
+Each ranking is stored as a snapshot under its own key, and pages are cut
+from it with a ``(snapshot, score, id)`` cursor. A like or follow mid-scroll
+only replaces the viewer's current ranking for their next fresh session: the
+cursor keeps reading the snapshot it started in, whose TTL is renewed on
+every page, so a reordered list never repeats or skips reels. Once the
+ranking runs out the feed continues with every other active reel, newest
+first, by keyset on ``(created_at, id)``.
+
+The pure functions (``load_candidates``, ``build_affinity``, ``rank``) also back
+the evaluate_reel_ranking command, which replays them as of a past date.
+"""
+import heapq
+import math
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import F
+
+from accounts.models import Follow
+from posts.models import Post, Like, Comment, Save, Share
+from . import trending
+from .counters import _actual_count
+from .pagination import CursorPage, decode_cursor, encode_cursor, keyset_filter
+
+Candidate = namedtuple('Candidate', ['id', 'author_id', 'created_at', 'engagement'])
+Affinity = namedtuple('Affinity', ['authors', 'following', 'engaged'])
+
+DEFAULT_WEIGHTS = {
+    'follow': 2.0,
+    'affinity': 1.0,
+    'popularity': 0.5,
+    'freshness': 1.5,
+    'seen': 3.0,
+}
+
+# How much each kind of past engagement with an author's reels counts towards affinity
+ENGAGEMENT_WEIGHTS = {
+    Like: 1.0,
+    Save: 2.0,
+    Share: 3.0,
+}
+
+POOL_KEY = 'reels:candidates'
+
+# Cursor phases: inside a ranking snapshot, then the remaining reels newest first
+RANKED = 'ranked'
+LATEST = 'latest'
+
+
+def candidate_pool_size():
+    return getattr(settings, 'REELS_CANDIDATE_POOL', 500)
+
+
+def ranking_size():
+    return getattr(settings, 'REELS_RANKING_SIZE', 200)
+
+
+def ranking_ttl():
+    return getattr(settings, 'REELS_RANKING_TTL', 300)
+
+
+def freshness_half_life_seconds():
+    return getattr(settings, 'REELS_FRESHNESS_HALF_LIFE_HOURS', 48) * 3600
+
+
+def weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'REELS_RANKING_WEIGHTS', {})}
+
+
+def _user_key(prefix, user_id):
+    return f'reels:{prefix}:{user_id or "anon"}'
+
+
+# Stage 1: candidates
+
+def load_candidates(before=None, limit=None):
+    """
+    Load the most recent active reels as Candidates.
+
+    With ``before``, only reels created before it are loaded and engagement is
+    counted as of that moment, so offline evaluation does not see the future.
+    """
+    reels = Post.objects.filter(post_type='reel', is_active=True)
+    w = trending.weights()
+    if before is None:
+        engagement = (
+            w['likes'] * F('likes_count') + w['comments'] * F('comments_count') +
+            w['saves'] * F('saves_count') + w['shares'] * F('shares_count')
+        )
+    else:
+        reels = reels.filter(created_at__lt=before)
+        as_of = {'created_at__lt': before}
+        engagement = (
+            w['likes'] * _actual_count(Like, 'post', as_of) +
+            w['comments'] * _actual_count(Comment, 'post', as_of) +
+            w['saves'] * _actual_count(Save, 'post', as_of) +
+            w['shares'] * _actual_count(Share, 'post', as_of)
+        )
+
+    rows = reels.annotate(engagement=engagement).order_by('-created_at', '-id').values_list(
+        'id', 'author_id', 'created_at', 'engagement'
+    )[:limit or candidate_pool_size()]
+    return [
+        Candidate(post_id, author_id, created_at.timestamp(), float(score))
+        for post_id, author_id, created_at, score in rows
+    ]
+
+
+def candidate_pool():
+    """The shared candidate pool and its version, building it on a cache miss"""
+    pool = cache.get(POOL_KEY)
+    if pool is None:
+        pool = {'version': time.time_ns(), 'candidates': load_candidates()}
+        cache.set(POOL_KEY, pool, ranking_ttl())
+    return pool
+
+
+def invalidate_pool():
+    cache.delete(POOL_KEY)
+
+
+# Stage 2: affinity
+
+def build_affinity(user_id, before=None):
+    """Compute a user's author affinity vector, optionally as of ``before``"""
+    authors = defaultdict(float)
+    engaged = set()
+    for model, weight in ENGAGEMENT_WEIGHTS.items():
+        rows = model.objects.filter(user_id=user_id, post__post_type='reel')
+        if before is not None:
+            rows = rows.filter(created_at__lt=before)
+        for post_id, author_id in rows.values_list('post_id', 'post__author_id'):
+            engaged.add(post_id)
+            if author_id != user_id:
+                authors[author_id] += weight
+
+    following = Follow.objects.filter(follower_id=user_id)
+    if before is not None:
+        following = following.filter(created_at__lt=before)
+    return Affinity(dict(authors), set(following.values_list('following_id', flat=True)), engaged)
+
+
+def affinity_for(user):
+    if not user.is_authenticated:
+        return Affinity({}, set(), set())
+
+    key = _user_key('affinity', user.pk)
+    affinity = cache.get(key)
+    if affinity is None:
+        affinity = build_affinity(user.pk)
+        cache.set(key, affinity, ranking_ttl())
+    return affinity
+
+
+def invalidate_user(user_id):
+    """
+    Drop a user's cached affinity and current ranking after they engage or
+    follow; snapshots being scrolled through are kept until they expire
+    """
+    cache.delete_many([_user_key('affinity', user_id), _user_key('ranking', user_id)])
+
+
+# Stage 3: ranking
+
+def rank(candidates, affinity, now=None, size=None):
+    """Score candidates for one viewer and return the top ``size`` as (score, id) pairs"""
+    w = weights()
+    now = now or time.time()
+    half_life = freshness_half_life_seconds()
+
+    def score(candidate):
+        value = (
+            w['popularity'] * math.log1p(max(candidate.engagement, 0)) +
+            w['freshness'] * 2 ** (-max(now - candidate.created_at, 0) / half_life)
+        )
+        if candidate.author_id in affinity.following:
+            value += w['follow']
+        if candidate.author_id in affinity.authors:
+            value += w['affinity'] * math.log1p(affinity.authors[candidate.author_id])
+        if candidate.id in affinity.engaged:
+            value -= w['seen']
+        return value
+
+    return heapq.nlargest(size or ranking_size(), ((score(c), c.id) for c in candidates))
+
+
+def _user_id(user):
+    return user.pk if user.is_authenticated else None
+
+
+def _snapshot_key(user_id, snapshot):
+    return f'{_user_key("ranking", user_id)}:{snapshot}'
+
+
+def ranking_for(user):
+    """
+    The viewer's current top-K ranking as ``(snapshot, ranking)``, rebuilt
+    when the candidate pool or their affinity changes
+    """
+    pool = candidate_pool()
+    user_id = _user_id(user)
+    key = _user_key('ranking', user_id)
+    current = cache.get(key)
+    if current is not None and current['version'] == pool['version']:
+        ranking = cache.get(_snapshot_key(user_id, current['snapshot']))
+        if ranking is not None:
+            return current['snapshot'], ranking
+
+    snapshot = time.time_ns()
+    ranking = rank(pool['candidates'], affinity_for(user))
+    cache.set_many({
+        key: {'version': pool['version'], 'snapshot': snapshot},
+        _snapshot_key(user_id, snapshot): ranking,
+    }, ranking_ttl())
+    return snapshot, ranking
+
+
+def snapshot_ranking(user, snapshot):
+    """A ranking handed out earlier, kept alive while the viewer scrolls through it"""
+    key = _snapshot_key(_user_id(user), snapshot)
+    ranking = cache.get(key)
+    if ranking is not None:
+        cache.touch(key, ranking_ttl())
+    return ranking
+
+
+def _position(cursor):
+    """``(phase, snapshot, after)`` from a reels cursor, or None if it is malformed"""
+    values = decode_cursor(cursor, size=4)
+    if values is None or values[0] not in (RANKED, LATEST):
+        return None
+    phase, snapshot, first, last = values
+    try:
+        snapshot = int(snapshot)
+        if phase == RANKED:
+            after = (float(first), int(last))
+        elif first is None:
+            after = None
+        else:
+            after = (Post._meta.get_field('created_at').to_python(first), int(last))
+    except (ValidationError, TypeError, ValueError):
+        return None
+    return phase, snapshot, after
+
+
+def reel_page(user, cursor=None, per_page=5):
+    """
+    Return one CursorPage of reels for ``user``: their ranking first, then
+    the reels it left out, newest first
+    """
+    phase, snapshot, after = _position(cursor) or (RANKED, None, None)
+    ranking = snapshot_ranking(user, snapshot) if snapshot is not None else None
+    if ranking is None:
+        # A fresh session, or the snapshot expired: go on in the current ranking
+        snapshot, ranking = ranking_for(user)
+
+    entries = []
+    start = len(ranking)
+    if phase == RANKED:
+        start = 0
+        if after is not None:
+            # The ranking is sorted by (score, id) descending
+            start = next((i for i, entry in enumerate(ranking) if entry < after), len(ranking))
+        entries = ranking[start:start + per_page]
+    post_ids = [post_id for _, post_id in entries]
+
+    next_cursor = None
+    if start + per_page < len(ranking):
+        next_cursor = encode_cursor([RANKED, snapshot, *entries[-1]])
+    else:
+        # Past the end of the ranking: fill the page with the remaining reels
+        latest = Post.objects.filter(post_type='reel', is_active=True).exclude(
+            id__in=[post_id for _, post_id in ranking]
+        )
+        if phase == LATEST and after is not None:
+            latest = latest.filter(keyset_filter(('-created_at', '-id'), after))
+        wanted = per_page - len(entries)
+        rows = list(latest.order_by('-created_at', '-id').values_list('created_at', 'id')[:wanted + 1])
+        post_ids.extend(post_id for _, post_id in rows[:wanted])
+        if len(rows) > wanted:
+            last = rows[wanted - 1] if wanted else (None, None)
+            next_cursor = encode_cursor([LATEST, snapshot, *last])
+
+    by_id = Post.objects.filter(id__in=post_ids, is_active=True).select_related('author').in_bulk()
+    return CursorPage([by_id[post_id] for post_id in post_ids if post_id in by_id], next_cursor)
@@ -0,0 +1,366 @@
+"""
+Full-text search over posts and users.
+
+Posts are indexed on their content, caption, hashtags and author names; users
+on their names and bio. Two interchangeable backends share one interface:
+
+* ``SQLiteFTSBackend`` stores documents in an FTS5 virtual table (created by
+  core migration 0004) and ranks with SQLite's built-in BM25.
+* ``PythonIndexBackend`` keeps an in-process inverted index with the same
+  BM25 ranking, for databases without FTS5. It is built lazily from the
+  database. Writes made by other processes (other servers, run_workers) are
+  picked up before a search at most every ``SEARCH_REFRESH_SECONDS``: users
+  and posts whose ``updated_at`` moved past the index's sync stamp are
+  re-indexed, and a document count that no longer matches the database
+  (rows deleted elsewhere) triggers a full rebuild.
+
+The index is kept in sync by the Post/User signal handlers in core.signals
+and can be rebuilt from scratch with ``manage.py rebuild_search_index``.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from posts.models import Post
+
+User = get_user_model()
+
+FTS_TABLE = 'core_search_index'
+
+# Indexed columns and their BM25 weights
+FIELDS = ['content', 'caption', 'hashtags', 'author']
+FIELD_WEIGHTS = {'content': 1.0, 'caption': 1.0, 'hashtags': 2.0, 'author': 3.0}
+
+DOC_POST = 'post'
+DOC_USER = 'user'
+
+# Rows committed a little after they were stamped are still picked up
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+TOKEN_RE = re.compile(r'\w+')
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def author_text(user):
+    return ' '.join(filter(None, [user.username, user.first_name, user.last_name]))
+
+
+def post_document(post, author=None):
+    """Build the indexed fields for a post (``author`` avoids a lookup when already loaded)"""
+    author = author or post.author
+    text = f'{post.content} {post.caption}'
+    return {
+        'content': post.content,
+        'caption': post.caption,
+        'hashtags': ' '.join(HASHTAG_RE.findall(text)),
+        'author': author_text(author),
+    }
+
+
+def user_document(user):
+    return {
+        'content': user.bio,
+        'caption': '',
+        'hashtags': '',
+        'author': author_text(user),
+    }
+
+
+def _rowid(doc_type, doc_id):
+    # Posts and users share one table, so interleave their ids
+    return doc_id * 2 + (1 if doc_type == DOC_USER else 0)
+
+
+class SQLiteFTSBackend:
+    """Search backend on an SQLite FTS5 table"""
+
+    def index(self, doc_type, doc_id, document):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [_rowid(doc_type, doc_id)])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, doc_type, doc_id, content, caption, hashtags, author) '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                [_rowid(doc_type, doc_id), doc_type, doc_id] + [document[field] for field in FIELDS]
+            )
+
+    def remove(self, doc_type, doc_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [_rowid(doc_type, doc_id)])
+
+    def get(self, doc_type, doc_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT content, caption, hashtags, author FROM {FTS_TABLE} WHERE rowid = %s',
+                [_rowid(doc_type, doc_id)]
+            )
+            row = cursor.fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, doc_type, query, limit, after=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # Every term must match, as a prefix of some indexed word
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in FIELDS)
+        # bm25() is negative with lower being better; flip it so higher scores rank first
+        sql = (
+            f'SELECT doc_id, -bm25({FTS_TABLE}, 0, 0, {weights}) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND doc_type = %s'
+        )
+        params = [match, doc_type]
+        if after is not None:
+            sql = f'SELECT doc_id, score FROM ({sql}) WHERE score < %s OR (score = %s AND doc_id > %s)'
+            params += [after[1], after[1], after[0]]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} ORDER BY score DESC, doc_id LIMIT %s', params + [limit])
+            return cursor.fetchall()
+
+
+class PythonIndexBackend:
+    """In-process inverted index with BM25 ranking, used when FTS5 is unavailable"""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.synced_at = None  # updated_at stamp the index has caught up to
+        self.checked_at = 0.0  # time.monotonic() of the last refresh
+        self.documents = {}  # (doc_type, doc_id) -> document
+        self.lengths = {}  # (doc_type, doc_id) -> weighted token count
+        self.postings = defaultdict(dict)  # term -> {(doc_type, doc_id): weighted term frequency}
+        self.terms = []  # Sorted vocabulary, for prefix lookups
+        self.stats = defaultdict(lambda: [0, 0.0])  # doc_type -> [document count, total length]
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.loaded = True
+                    self.synced_at = timezone.now()
+                    self.checked_at = time.monotonic()
+                    rebuild(self)
+
+    def _ensure_fresh(self):
+        self._ensure_loaded()
+        if time.monotonic() - self.checked_at >= refresh_seconds():
+            self.refresh()
+
+    def refresh(self):
+        """Catch up with writes made by other processes since the last sync"""
+        with self.lock:
+            since = self.synced_at - REFRESH_OVERLAP
+            self.synced_at = timezone.now()
+            self.checked_at = time.monotonic()
+
+            for user in User.objects.filter(updated_at__gte=since):
+                if user.is_active:
+                    index_user(user, backend=self)
+                else:
+                    self._remove(DOC_USER, user.pk)
+            for post in Post.objects.filter(updated_at__gte=since).select_related('author'):
+                index_post(post, backend=self)
+
+            # Hard deletes leave no row to notice; start over when the counts disagree
+            if (
+                self.stats[DOC_USER][0] != User.objects.filter(is_active=True).count()
+                or self.stats[DOC_POST][0] != Post.objects.filter(is_active=True).count()
+            ):
+                rebuild(self)
+
+    def _weighted_terms(self, document):
+        frequencies = defaultdict(float)
+        for field in FIELDS:
+            for term in tokenize(document[field]):
+                frequencies[term] += FIELD_WEIGHTS[field]
+        return frequencies
+
+    def index(self, doc_type, doc_id, document):
+        with self.lock:
+            self._remove(doc_type, doc_id)
+            key = (doc_type, doc_id)
+            frequencies = self._weighted_terms(document)
+            for term, frequency in frequencies.items():
+                if term not in self.postings:
+                    bisect.insort(self.terms, term)
+                self.postings[term][key] = frequency
+            self.documents[key] = document
+            self.lengths[key] = sum(frequencies.values())
+            self.stats[doc_type][0] += 1
+            self.stats[doc_type][1] += self.lengths[key]
+
+    def _remove(self, doc_type, doc_id):
+        key = (doc_type, doc_id)
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        self.stats[doc_type][0] -= 1
+        self.stats[doc_type][1] -= self.lengths.pop(key)
+        for term in self._weighted_terms(document):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
+                    self.terms.pop(bisect.bisect_left(self.terms, term))
+
+    def remove(self, doc_type, doc_id):
+        with self.lock:
+            self._remove(doc_type, doc_id)
+
+    def get(self, doc_type, doc_id):
+        self._ensure_loaded()
+        return self.documents.get((doc_type, doc_id))
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.lengths.clear()
+            self.postings.clear()
+            self.terms.clear()
+            self.stats.clear()
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff')
+        return self.terms[start:end]
+
+    def search(self, doc_type, query, limit, after=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._ensure_fresh()
+
+        with self.lock:
+            total, total_length = self.stats[doc_type]
+            if not total:
+                return []
+            average_length = total_length / total or 1
+
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for word in self._expand(term):
+                    postings = {key: tf for key, tf in self.postings[word].items() if key[0] == doc_type}
+                    idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, tf in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.lengths[key] / average_length)
+                        term_scores[key] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+                # Every term must match
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+
+        ranked = sorted((-score, key[1]) for key, score in scores.items())
+        if after is not None:
+            ranked = [(score, doc_id) for score, doc_id in ranked if (score, doc_id) > (-after[1], after[0])]
+        return [(doc_id, -score) for score, doc_id in ranked[:limit]]
+
+
+def refresh_seconds():
+    return getattr(settings, 'SEARCH_REFRESH_SECONDS', 5)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+                if name == 'sqlite_fts' or (name == 'auto' and fts_available()):
+                    _backend = SQLiteFTSBackend()
+                else:
+                    _backend = PythonIndexBackend()
+    return _backend
+
+
+def index_post(post, backend=None):
+    backend = backend or get_backend()
+    if post.is_active:
+        backend.index(DOC_POST, post.pk, post_document(post))
+    else:
+        backend.remove(DOC_POST, post.pk)
+
+
+def remove_post(post_id):
+    get_backend().remove(DOC_POST, post_id)
+
+
+def index_user(user, backend=None):
+    """Index a user, re-indexing their posts only if their name changed"""
+    backend = backend or get_backend()
+    document = user_document(user)
+    previous = backend.get(DOC_USER, user.pk)
+    if previous == document:
+        return
+
+    backend.index(DOC_USER, user.pk, document)
+    if previous is not None and previous['author'] != document['author']:
+        for post in Post.objects.filter(author=user, is_active=True).iterator(chunk_size=500):
+            backend.index(DOC_POST, post.pk, post_document(post, author=user))
+
+
+def remove_user(user_id):
+    get_backend().remove(DOC_USER, user_id)
+
+
+def search_posts(query, limit=20, after=None):
+    """
+    Return ``(post_id, score)`` pairs, best match first.
+
+    ``after`` is the last ``(post_id, score)`` pair already shown, for keyset
+    pagination over the ranking.
+    """
+    return get_backend().search(DOC_POST, query, limit, after)
+
+
+def search_users(query, limit=20, after=None):
+    """Return ``(user_id, score)`` pairs, best match first"""
+    return get_backend().search(DOC_USER, query, limit, after)
+
+
+def rebuild(backend=None, batch_size=500):
+    """Re-index every active post and user; returns the number of documents"""
+    backend = backend or get_backend()
+    backend.clear()
+
+    indexed = 0
+    for user in User.objects.filter(is_active=True).iterator(chunk_size=batch_size):
+        backend.index(DOC_USER, user.pk, user_document(user))
+        indexed += 1
+    for post in Post.objects.filter(is_active=True).select_related('author').iterator(chunk_size=batch_size):
+        backend.index(DOC_POST, post.pk, post_document(post))
+        indexed += 1
+    return indexed
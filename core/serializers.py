@@ -0,0 +1,83 @@
+from django.urls import reverse
+
+from .images import rendition_url
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'message': notification.summary,
+        'sender': notification.sender.username,
+        'actor_count': notification.actor_count,
+        'post_id': notification.post_id,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+        'updated_at': notification.updated_at.isoformat(),
+    }
+
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'content': message.content,
+        'sender': message.sender.username,
+        'is_read': message.is_read,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def serialize_conversation(member):
+    """An inbox row: a ConversationMember from core.conversations.inbox_page"""
+    conversation = member.conversation
+    last_message = conversation.last_message
+    return {
+        'id': conversation.id,
+        'other': {
+            'id': member.other.id,
+            'username': member.other.username,
+            'profile_picture': rendition_url(member.other.profile_picture, 'avatar_40'),
+        },
+        'last_message': serialize_message(last_message) if last_message else None,
+        'unread_count': member.unread_count,
+        'last_message_at': member.last_message_at.isoformat(),
+    }
+
+
+def serialize_story(story):
+    return {
+        'id': story.id,
+        'content': story.content,
+        'image': rendition_url(story.image, 'story'),
+        'video': story.video.url if story.video else None,
+        'seen': story.seen,
+        'created_at': story.created_at.isoformat(),
+        'expires_at': story.expires_at.isoformat(),
+    }
+
+
+def serialize_story_group(group):
+    author = group['author']
+    return {
+        'author': {
+            'id': author.id,
+            'username': author.username,
+            'profile_picture': rendition_url(author.profile_picture, 'avatar_150'),
+        },
+        'has_unseen': group['has_unseen'],
+        'stories': [serialize_story(story) for story in group['stories']],
+    }
+
+
+def serialize_suggestion(suggestion):
+    candidate = suggestion.candidate
+    return {
+        'id': candidate.id,
+        'username': candidate.username,
+        'full_name': candidate.get_full_name(),
+        'profile_picture': rendition_url(candidate.profile_picture, 'avatar_150'),
+        'url': reverse('accounts:profile', args=[candidate.username]),
+        'mutual_count': suggestion.mutual_count,
+        'follows_you': suggestion.follows_user,
+    }
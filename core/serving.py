@@ -0,0 +1,186 @@
+"""
+Media file responses with HTTP range and conditional request support.
+
+``file_response`` answers GET/HEAD for a file on disk the way a static file
+server would:
+
+* a strong ``ETag`` (size and modification time) and ``Last-Modified``,
+  answering ``If-None-Match``/``If-Modified-Since`` with 304;
+* ``Accept-Ranges: bytes``, serving a single ``Range`` with 206 (or 416 when
+  it cannot be satisfied) unless an ``If-Range`` validator no longer matches,
+  so seeking in a video only downloads what the player asks for;
+* the body as a FileResponse over the open file, which WSGI servers that
+  provide ``wsgi.file_wrapper`` (gunicorn, uWSGI) send with ``sendfile()``
+  instead of reading it through Python.
+
+With ``MEDIA_SENDFILE_BACKEND`` set, files under MEDIA_ROOT are not sent by
+Django at all: the response only carries the headers plus
+``X-Accel-Redirect`` (``'nginx'``, under ``MEDIA_ACCEL_REDIRECT_PREFIX``, an
+``internal`` location aliased to MEDIA_ROOT) or ``X-Sendfile`` (``'apache'``,
+the absolute path), and the proxy serves the file, ranges included.
+"""
+import mimetypes
+import os
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sendfile_backend():
+    return getattr(settings, 'MEDIA_SENDFILE_BACKEND', '')
+
+
+def media_max_age():
+    return getattr(settings, 'MEDIA_MAX_AGE', 86400)
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of an open file starting at ``start``"""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        # sendfile() starts from the descriptor's position and stops at Content-Length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def etag_for(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive for a single byte range, None to ignore it, or 'unsatisfiable'"""
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple or malformed ranges; serving the whole file is always allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and int(mtime) <= since
+
+
+def _range_applies(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        # Strong comparison; weak tags never match
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def _accel_headers(response, path):
+    """Hand the body to the front proxy; returns False for files it cannot reach"""
+    backend = sendfile_backend()
+    if backend == 'apache':
+        response['X-Sendfile'] = str(path)
+        return True
+    if backend == 'nginx':
+        try:
+            relative = Path(path).resolve().relative_to(Path(settings.MEDIA_ROOT).resolve())
+        except ValueError:
+            return False
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative.as_posix())
+        return True
+    return False
+
+
+def file_response(request, path, content_type=None, etag=None, cache_control=None):
+    """Serve ``path`` with validators, range support and sendfile/proxy offload"""
+    try:
+        file = open(path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404
+    stat = os.fstat(file.fileno())
+    etag = etag or etag_for(stat)
+    content_type = content_type or mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control or f'public, max-age={media_max_age()}',
+        'Accept-Ranges': 'bytes',
+    }
+
+    def finish(response):
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    if _not_modified(request, etag, stat.st_mtime):
+        file.close()
+        return finish(HttpResponseNotModified())
+
+    if sendfile_backend():
+        response = HttpResponse(content_type=content_type)
+        if _accel_headers(response, path):
+            # The proxy applies Range itself
+            file.close()
+            del headers['Accept-Ranges']
+            return finish(response)
+
+    size = stat.st_size
+    start, end = 0, size - 1
+    status = 200
+    requested = request.headers.get('Range')
+    if requested and request.method in ('GET', 'HEAD') and _range_applies(request, etag, stat.st_mtime):
+        byte_range = parse_range(requested, size)
+        if byte_range == 'unsatisfiable':
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return finish(response)
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+    length = end - start + 1 if size else 0
+
+    if request.method == 'HEAD':
+        file.close()
+        response = HttpResponse(content_type=content_type, status=status)
+    else:
+        response = FileResponse(RangeFile(file, start, length), content_type=content_type, status=status)
+    response['Content-Length'] = length
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return finish(response)
@@ -0,0 +1,228 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from posts.models import Post, Like, Comment, Save, Share
+from posts import comments as comment_threads
+from accounts.models import Follow
+from .models import ImageRendition, Notification, Message, Story
+from . import counters, follow_graph, images, jobs, profile_pictures, realtime, recommendations, search, suggestions, timeline, unread
+
+User = get_user_model()
+
+
+def queue_renditions(owner_type, instance, field, update_fields):
+    """Render a changed upload off the request (see core/images.py)"""
+    if update_fields is not None and field not in update_fields:
+        return
+
+    name = getattr(instance, field).name
+    payload = {'owner_type': owner_type, 'owner_id': instance.pk}
+    if images.wants_renditions(name):
+        # The key makes re-saving an unchanged file a no-op
+        jobs.enqueue('images.render', payload, key=f'images.render:{name}')
+    elif ImageRendition.objects.filter(owner_type=owner_type, owner_id=instance.pk).exists():
+        # The image was removed; the job deletes its renditions
+        jobs.enqueue('images.render', payload)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # A deleted post being restored goes back into timelines like a new one
+    instance._reactivated = (
+        not raw
+        and not instance._state.adding
+        and instance.is_active
+        and Post.objects.filter(pk=instance.pk, is_active=False).exists()
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    if created:
+        counters.adjust(User, instance.author_id, 1, 'posts_count')
+        jobs.enqueue('trending.refresh', {'post_id': instance.pk})
+
+    reactivated = getattr(instance, '_reactivated', False)
+    if not instance.is_active:
+        timeline.remove_post(instance)
+    elif created or reactivated:
+        jobs.enqueue('timeline.fan_out', {'post_id': instance.pk})
+    transaction.on_commit(lambda: search.index_post(instance))
+
+    queue_renditions('post', instance, 'image', kwargs.get('update_fields'))
+
+    if instance.post_type == 'reel' and (created or reactivated or not instance.is_active):
+        transaction.on_commit(recommendations.invalidate_pool)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.adjust(User, instance.author_id, -1, 'posts_count')
+    transaction.on_commit(lambda: search.remove_post(instance.pk))
+    if instance.image:
+        jobs.enqueue('images.render', {'owner_type': 'post', 'owner_id': instance.pk})
+    if instance.post_type == 'reel':
+        transaction.on_commit(recommendations.invalidate_pool)
+
+
+@receiver(post_save, sender=Story)
+def story_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        queue_renditions('story', instance, 'image', kwargs.get('update_fields'))
+
+
+@receiver(post_delete, sender=Story)
+def story_deleted(sender, instance, **kwargs):
+    if instance.image:
+        jobs.enqueue('images.render', {'owner_type': 'story', 'owner_id': instance.pk})
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, **kwargs):
+    # Only a newly set picture is known to be in storage after the save
+    update_fields = kwargs.get('update_fields')
+    instance._picture_changed = (
+        not raw
+        and bool(instance.profile_picture)
+        and (update_fields is None or 'profile_picture' in update_fields)
+        and (
+            instance._state.adding
+            or not User.objects.filter(pk=instance.pk, profile_picture=instance.profile_picture.name).exists()
+        )
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    queue_renditions('user', instance, 'profile_picture', kwargs.get('update_fields'))
+    if getattr(instance, '_picture_changed', False):
+        # The file is in storage by now; templates need not check it again
+        profile_pictures.remember(instance.profile_picture.name)
+
+    if instance.is_active:
+        transaction.on_commit(lambda: search.index_user(instance))
+    else:
+        transaction.on_commit(lambda: search.remove_user(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.remove_user(instance.pk))
+    if instance.profile_picture:
+        profile_pictures.forget(instance.profile_picture.name)
+        jobs.enqueue('images.render', {'owner_type': 'user', 'owner_id': instance.pk})
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(User, instance.follower_id, 1, 'following_count')
+        counters.adjust(User, instance.following_id, 1, 'followers_count')
+        jobs.enqueue('timeline.follow_added', {
+            'follower_id': instance.follower_id,
+            'following_id': instance.following_id,
+        })
+        recommendations.invalidate_user(instance.follower_id)
+        _invalidate_follow_graph(instance)
+        suggestions.followed(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.adjust(User, instance.follower_id, -1, 'following_count')
+    counters.adjust(User, instance.following_id, -1, 'followers_count')
+    timeline.follow_removed(instance.follower_id, instance.following_id)
+    recommendations.invalidate_user(instance.follower_id)
+    _invalidate_follow_graph(instance)
+    jobs.enqueue('suggestions.refresh', {'user_ids': [instance.follower_id, instance.following_id]})
+
+
+def _invalidate_follow_graph(follow):
+    # After commit, so a concurrent read cannot cache the lists from before the change
+    transaction.on_commit(lambda: follow_graph.invalidate(follow.follower_id, follow.following_id))
+
+
+# Post engagement counters
+
+POST_COUNTERS = {
+    Like: 'likes_count',
+    Save: 'saves_count',
+    Share: 'shares_count',
+}
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Save)
+@receiver(post_save, sender=Share)
+def increment_post_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(Post, instance.post_id, 1, POST_COUNTERS[sender])
+        jobs.enqueue('trending.refresh', {'post_id': instance.post_id})
+        recommendations.invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Save)
+@receiver(post_delete, sender=Share)
+def decrement_post_counter(sender, instance, **kwargs):
+    counters.adjust(Post, instance.post_id, -1, POST_COUNTERS[sender])
+    jobs.enqueue('trending.refresh', {'post_id': instance.post_id})
+    recommendations.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(Post, instance.post_id, 1, 'comments_count')
+        jobs.enqueue('trending.refresh', {'post_id': instance.post_id})
+        if instance.parent_id and instance.is_active:
+            counters.adjust(Comment, instance.parent_id, 1, 'replies_count')
+        # Path, depth and the ancestors' descendant counts (see posts/comments.py)
+        comment_threads.place(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_counters(sender, instance, **kwargs):
+    counters.adjust(Post, instance.post_id, -1, 'comments_count')
+    jobs.enqueue('trending.refresh', {'post_id': instance.post_id})
+    if instance.parent_id and instance.is_active:
+        counters.adjust(Comment, instance.parent_id, -1, 'replies_count')
+        comment_threads.count_in_ancestors(instance, -1)
+
+
+# Unread counters (see core/unread.py) and realtime push (see core/realtime.py)
+
+UNREAD_KINDS = {
+    Notification: unread.NOTIFICATIONS,
+    Message: unread.MESSAGES,
+}
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        if not instance.is_read:
+            transaction.on_commit(lambda: unread.increment(instance.recipient_id, unread.NOTIFICATIONS))
+        transaction.on_commit(lambda: realtime.publish_notification(instance))
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        if not instance.is_read:
+            transaction.on_commit(lambda: unread.increment(instance.recipient_id, unread.MESSAGES))
+        transaction.on_commit(lambda: realtime.publish_message(instance))
+
+
+@receiver(post_delete, sender=Notification)
+@receiver(post_delete, sender=Message)
+def unread_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        transaction.on_commit(lambda: unread.invalidate(instance.recipient_id, UNREAD_KINDS[sender]))
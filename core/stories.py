@@ -0,0 +1,128 @@
+"""
+Stories: the tray of live stories, per-viewer seen state and expiry.
+
+The tray holds the live (active, unexpired) stories of the viewer and the
+people they follow. It is one query over the partial ``core_story_tray_idx``
+index on (author, expires_at), grouped by author in Python. Every story
+lives for the same ``STORY_LIFETIME_HOURS``, so expiry order is also the
+order the stories were posted in.
+
+Seen state is one StorySeen row per (viewer, author): the id of the latest
+story the viewer has watched. Stories are watched in order, so everything
+up to that id is seen. The row never grows with the number of stories, and
+a single query per tray fetches it.
+
+``sweep`` (run periodically with ``manage.py expire_stories``) deactivates
+expired stories in batches, or deletes them along with their media files,
+and drops seen-state rows older than any live story.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from . import follow_graph
+from .models import Story, StorySeen
+
+
+def lifetime():
+    return timedelta(hours=getattr(settings, 'STORY_LIFETIME_HOURS', 24))
+
+
+def live(author_ids, now=None):
+    """Live stories of ``author_ids``, by author and then in the order they were posted"""
+    return Story.objects.filter(
+        author_id__in=author_ids,
+        is_active=True,
+        expires_at__gt=now or timezone.now(),
+    ).order_by('author_id', 'expires_at', 'id')
+
+
+def tray(user, now=None):
+    """
+    ``[{'author', 'stories', 'has_unseen'}]`` for ``user``'s story tray: their
+    own stories first, then authors with unseen stories, then the rest, each
+    by their latest story, newest first. Stories carry a ``seen`` flag.
+    """
+    author_ids = list(follow_graph.following_ids(user.pk))
+    author_ids.append(user.pk)
+
+    groups = {}
+    for story in live(author_ids, now).select_related('author'):
+        groups.setdefault(story.author_id, []).append(story)
+    if not groups:
+        return []
+
+    seen = dict(
+        StorySeen.objects.filter(viewer=user, author_id__in=groups).values_list('author_id', 'last_seen_id')
+    )
+    tray = []
+    for author_id, author_stories in groups.items():
+        last_seen = seen.get(author_id, 0)
+        for story in author_stories:
+            story.seen = author_id == user.pk or story.pk <= last_seen
+        tray.append({
+            'author': author_stories[0].author,
+            'stories': author_stories,
+            'has_unseen': not author_stories[-1].seen,
+        })
+
+    tray.sort(key=lambda group: (
+        group['author'].pk != user.pk,
+        not group['has_unseen'],
+        -group['stories'][-1].pk,
+    ))
+    return tray
+
+
+def mark_seen(viewer, story_id):
+    """Record that ``viewer`` watched a story (and so every earlier one by its author)"""
+    author_id = Story.objects.filter(pk=story_id, is_active=True).values_list('author_id', flat=True).first()
+    if author_id is None or author_id == viewer.pk:
+        return False
+
+    # Only ever moves forward, so re-watching an old story changes nothing
+    advanced = StorySeen.objects.filter(viewer=viewer, author_id=author_id, last_seen_id__lt=story_id).update(
+        last_seen_id=story_id, updated_at=timezone.now()
+    )
+    if not advanced:
+        StorySeen.objects.get_or_create(viewer=viewer, author_id=author_id, defaults={'last_seen_id': story_id})
+    return True
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def sweep(batch_size=500, delete=False, now=None):
+    """
+    Deactivate (or, with ``delete``, delete with their media) stories past
+    their expiry, ``batch_size`` at a time; returns how many.
+    """
+    now = now or timezone.now()
+    expired = Story.objects.filter(expires_at__lte=now)
+    if not delete:
+        expired = expired.filter(is_active=True)
+
+    swept = 0
+    while True:
+        batch = list(expired.order_by('expires_at', 'id').values_list('id', 'image', 'video')[:batch_size])
+        if not batch:
+            break
+        ids = [story_id for story_id, _, _ in batch]
+        with transaction.atomic():
+            if delete:
+                files = [name for _, image, video in batch for name in (image, video) if name]
+                Story.objects.filter(id__in=ids).delete()
+                # Files go once the rows are gone for good
+                transaction.on_commit(lambda files=files: _delete_files(files))
+            else:
+                Story.objects.filter(id__in=ids).update(is_active=False)
+        swept += len(ids)
+
+    # Every story a row older than the lifetime points at has expired
+    StorySeen.objects.filter(updated_at__lt=now - lifetime()).delete()
+    return swept
@@ -0,0 +1,160 @@
+"""
+"People you may know" follow suggestions.
+
+Candidates are scored in batches of users, from the cached adjacency lists
+in core.follow_graph instead of a friends-of-friends self-join on Follow:
+
+* second-degree reach: every id followed by someone the user follows, each
+  counted once per such person (``mutual_count``). The following lists of
+  a whole batch's followees are fetched together, and the counting is one
+  ``Counter`` update over the concatenated id arrays;
+* co-engagement: recent likes, saves and comments by the user on a
+  candidate's posts, over ``SUGGESTION_ENGAGEMENT_DAYS``, one grouped query
+  per kind for the whole batch;
+* whether the candidate already follows the user.
+
+The scores are weighted by ``SUGGESTION_WEIGHTS``. The top
+``SUGGESTIONS_PER_USER`` per user replace that user's FollowSuggestion rows,
+so serving them is one read of ``core_suggestion_idx`` (user, -score).
+
+``manage.py refresh_suggestions`` recomputes everyone. A follow or unfollow
+drops the followed user from the follower's list at once and queues a
+refresh of both users (core.signals).
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from posts.models import Comment, Like, Save
+from . import follow_graph, jobs
+from .models import FollowSuggestion
+
+User = get_user_model()
+
+DEFAULT_WEIGHTS = {
+    'mutual': 1.0,
+    'engagement': 0.5,
+    'follows_you': 2.0,
+}
+
+# (engagement model, field holding the engaging user)
+ENGAGEMENT = [
+    (Like, 'user_id'),
+    (Save, 'user_id'),
+    (Comment, 'author_id'),
+]
+
+
+def weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'SUGGESTION_WEIGHTS', {})}
+
+
+def per_user():
+    return getattr(settings, 'SUGGESTIONS_PER_USER', 30)
+
+
+def engagement_window():
+    return timedelta(days=getattr(settings, 'SUGGESTION_ENGAGEMENT_DAYS', 30))
+
+
+def _engaged_authors(user_ids, since):
+    """``{user_id: Counter({author_id: interactions})}`` for recent engagement"""
+    engaged = defaultdict(Counter)
+    for model, user_field in ENGAGEMENT:
+        rows = model.objects.filter(
+            **{f'{user_field}__in': user_ids},
+            created_at__gte=since,
+        ).order_by().values_list(user_field, 'post__author_id').annotate(n=Count('pk'))
+        for user_id, author_id, n in rows:
+            engaged[user_id][author_id] += n
+    return engaged
+
+
+def compute(user_ids, now=None):
+    """``{user_id: [(score, candidate_id, mutual_count, follows_user)]}``, best first"""
+    user_ids = list(user_ids)
+    w = weights()
+    limit = per_user()
+
+    following = follow_graph.adjacency(follow_graph.FOLLOWING, user_ids)
+    followers = follow_graph.adjacency(follow_graph.FOLLOWERS, user_ids)
+    second = follow_graph.adjacency(follow_graph.FOLLOWING, set(chain.from_iterable(following.values())))
+    engaged = _engaged_authors(user_ids, (now or timezone.now()) - engagement_window())
+
+    scored = {}
+    for user_id in user_ids:
+        mutual = Counter(chain.from_iterable(second[followee] for followee in following[user_id]))
+        follows_user = set(followers[user_id])
+        engagement = engaged.get(user_id, Counter())
+
+        skip = set(following[user_id])
+        skip.add(user_id)
+        candidates = (set(mutual) | set(engagement) | follows_user) - skip
+        scored[user_id] = heapq.nlargest(limit, (
+            (
+                w['mutual'] * mutual[candidate]
+                + w['engagement'] * engagement[candidate]
+                + w['follows_you'] * (candidate in follows_user),
+                candidate,
+                mutual[candidate],
+                candidate in follows_user,
+            )
+            for candidate in candidates
+        ))
+
+    # Never suggest deactivated accounts
+    active = set(User.objects.filter(
+        id__in={candidate for ranked in scored.values() for _, candidate, _, _ in ranked},
+        is_active=True,
+    ).values_list('id', flat=True))
+    return {
+        user_id: [row for row in ranked if row[1] in active]
+        for user_id, ranked in scored.items()
+    }
+
+
+def refresh(user_ids):
+    """Recompute and store the suggestions of ``user_ids``; returns how many were stored"""
+    ranked = compute(user_ids)
+    rows = [
+        FollowSuggestion(
+            user_id=user_id,
+            candidate_id=candidate,
+            score=score,
+            mutual_count=mutual_count,
+            follows_user=follows_user,
+        )
+        for user_id, suggestions in ranked.items()
+        for score, candidate, mutual_count, follows_user in suggestions
+    ]
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=list(ranked)).delete()
+        FollowSuggestion.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def followed(follower_id, following_id):
+    """Take a newly followed user out of the follower's list, and refresh both users"""
+    FollowSuggestion.objects.filter(user_id=follower_id, candidate_id=following_id).delete()
+    jobs.enqueue('suggestions.refresh', {'user_ids': [follower_id, following_id]})
+
+
+def for_user(user, limit=10):
+    """Up to ``limit`` stored suggestions for ``user``, best first, with the candidates"""
+    suggestions = list(
+        FollowSuggestion.objects.filter(user=user, candidate__is_active=True)
+        .select_related('candidate')
+        .order_by('-score', 'candidate')[:limit]
+    )
+    if not suggestions and cache.add(f'suggestions:queued:{user.pk}', True, 3600):
+        # Nothing computed yet (a new account); build the list in the background
+        jobs.enqueue('suggestions.refresh', {'user_ids': [user.pk]})
+    return suggestions
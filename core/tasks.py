@@ -0,0 +1,53 @@
+"""
+Background job handlers (see core/jobs.py).
+
+Imported by CoreConfig.ready() so every handler is registered in both web
+and worker processes.
+"""
+from django.utils.dateparse import parse_datetime
+from posts.models import Post
+from . import images, jobs, notifications, suggestions, timeline, trending
+
+
+@jobs.task('notifications.record', batch=True)
+def record_notifications(payloads):
+    events = [
+        notifications.Event(
+            payload['recipient_id'],
+            payload['sender_id'],
+            payload['notification_type'],
+            payload['post_id'],
+            parse_datetime(payload['at']),
+        )
+        for payload in payloads
+    ]
+    # A like or follow may have been taken back before its job ran
+    notifications.record(notifications.still_current(events))
+
+
+@jobs.task('trending.refresh', batch=True)
+def refresh_trending(payloads):
+    trending.refresh_many(payload['post_id'] for payload in payloads)
+
+
+@jobs.task('timeline.fan_out')
+def fan_out(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        timeline.fan_out_post(post)
+
+
+@jobs.task('timeline.follow_added')
+def follow_added(follower_id, following_id):
+    timeline.follow_added(follower_id, following_id)
+
+
+@jobs.task('images.render')
+def render_images(owner_type, owner_id):
+    images.render(owner_type, owner_id)
+
+
+@jobs.task('suggestions.refresh', batch=True)
+def refresh_suggestions(payloads):
+    # One scoring pass for every user touched by the claimed follows
+    suggestions.refresh({user_id for payload in payloads for user_id in payload['user_ids']})
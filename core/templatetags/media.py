@@ -0,0 +1,67 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core.images import rendition_url, responsive_sources, wants_renditions
+
+register = template.Library()
+
+
+@register.filter
+def rendition(image, kind):
+    """URL of an uploaded image's ``kind`` rendition, e.g. {{ post.image|rendition:'feed' }}"""
+    return rendition_url(image, kind) or ''
+
+
+def _attrs(attrs):
+    return format_html_join('', ' {}="{}"', ((name, value) for name, value in attrs.items() if value is not None))
+
+
+def _srcset(candidates):
+    return ', '.join(f'{url} {width}w' for url, width in candidates)
+
+
+@register.simple_tag
+def responsive_image(image, family, sizes='100vw', eager=False, **attrs):
+    """
+    An <img> (in a <picture> when several formats are rendered) offering an
+    uploaded image at every width of a core.images.FAMILIES entry, e.g.
+    {% responsive_image post.image 'feed' sizes='(max-width: 640px) 100vw, 600px' alt='Post' class='post-media' %}
+
+    Images load lazily; pass ``eager=True`` for the page's main above-the-fold
+    image so it is fetched first.
+    """
+    if not image:
+        return ''
+
+    attrs = {'alt': '', **attrs}
+    if eager:
+        attrs.update(loading='eager', fetchpriority='high')
+    else:
+        attrs['loading'] = 'lazy'
+    attrs['decoding'] = 'async'
+
+    sources, size = responsive_sources(image, family) if wants_renditions(image.name) else ([], None)
+    if not sources:
+        return format_html('<img src="{}"{}>', image.url, _attrs(attrs))
+
+    if size is not None:
+        # Lets the browser reserve the image's box before it loads
+        attrs['width'], attrs['height'] = size
+
+    # The last format (JPEG by default) is the fallback every browser decodes
+    _, fallback = sources[-1]
+    img = format_html(
+        '<img src="{}" srcset="{}" sizes="{}"{}>',
+        fallback[-1][0], _srcset(fallback), sizes, _attrs(attrs),
+    )
+    if len(sources) == 1:
+        return img
+
+    # display: contents keeps <picture> out of the layout, so CSS written for a bare <img> still applies
+    return format_html(
+        '<picture style="display: contents">{}{}</picture>',
+        format_html_join('', '<source type="image/{}" srcset="{}" sizes="{}">', (
+            (name, _srcset(candidates), sizes) for name, candidates in sources[:-1]
+        )),
+        img,
+    )
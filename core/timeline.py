@@ -0,0 +1,218 @@
+"""
+Materialized home timelines.
+
+New posts are pushed into the TimelineEntry rows of their author and every
+follower when they are created (fan-out-on-write), so reading a page of the
+home feed is a single indexed range scan instead of an ``author__in`` query
+over everything the user follows.
+
+Authors with more than ``TIMELINE_FANOUT_MAX_FOLLOWERS`` followers are not
+fanned out; their posts are merged into the page at read time instead
+(fan-out-on-read), which keeps a single post from writing millions of rows.
+
+Following someone (and ``rebuild_timeline``) copies at most
+``TIMELINE_BACKFILL_SIZE`` of their posts. When that cuts history off, the
+user's TimelineHorizon records the newest post that may be missing; pages
+reaching past it are read with the pull query over everyone the user
+follows, so older posts stay in the feed without copying them all.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from accounts.models import Follow
+from posts.models import Post
+from . import follow_graph
+from .models import TimelineEntry, TimelineHorizon
+from .pagination import CursorPage, CursorPaginator, decode_cursor, encode_cursor, keyset_filter
+
+User = get_user_model()
+
+
+def fanout_max_followers():
+    return getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 5000)
+
+
+def backfill_size():
+    return getattr(settings, 'TIMELINE_BACKFILL_SIZE', 200)
+
+
+def batch_size():
+    return getattr(settings, 'TIMELINE_BATCH_SIZE', 1000)
+
+
+def is_high_fanout(author_id):
+    return User.objects.filter(pk=author_id, followers_count__gt=fanout_max_followers()).exists()
+
+
+def high_fanout_following(user):
+    """Ids of followed authors whose posts are merged in at read time"""
+    key = f'timeline:high-fanout:{user.pk}'
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(
+            User.objects.filter(
+                followers__follower=user,
+                followers_count__gt=fanout_max_followers()
+            ).values_list('id', flat=True)
+        )
+        cache.set(key, author_ids, 300)
+    return author_ids
+
+
+def _bulk_insert(entries):
+    size = batch_size()
+    for start in range(0, len(entries), size):
+        TimelineEntry.objects.bulk_create(entries[start:start + size], ignore_conflicts=True)
+
+
+def extend_horizon(user_id, created_at):
+    """Mark ``user_id``'s timeline as possibly missing posts up to ``created_at``"""
+    _, created = TimelineHorizon.objects.get_or_create(user_id=user_id, defaults={'created_at': created_at})
+    if not created:
+        TimelineHorizon.objects.filter(user_id=user_id, created_at__lt=created_at).update(created_at=created_at)
+
+
+def fan_out_post(post):
+    """Push a new (or reactivated) post into its author's and followers' timelines"""
+    if not post.is_active:
+        return
+
+    def entry(user_id):
+        return TimelineEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            created_at=post.created_at,
+        )
+
+    entries = [entry(post.author_id)]
+    if not is_high_fanout(post.author_id):
+        follower_ids = Follow.objects.filter(
+            following_id=post.author_id
+        ).values_list('follower_id', flat=True)
+        entries.extend(entry(follower_id) for follower_id in follower_ids.iterator(chunk_size=batch_size()))
+    _bulk_insert(entries)
+
+
+def remove_post(post):
+    """Drop a deactivated post from every timeline it was pushed into"""
+    TimelineEntry.objects.filter(post_id=post.pk).delete()
+
+
+def follow_added(follower_id, following_id):
+    """Backfill the recent posts of a newly followed author"""
+    if is_high_fanout(following_id):
+        cache.delete(f'timeline:high-fanout:{follower_id}')
+        return
+
+    recent = Post.objects.filter(
+        author_id=following_id,
+        is_active=True
+    ).order_by('-created_at', '-id').values_list('id', 'created_at')[:backfill_size()]
+    recent = list(recent)
+    _bulk_insert([
+        TimelineEntry(user_id=follower_id, post_id=post_id, author_id=following_id, created_at=created_at)
+        for post_id, created_at in recent
+    ])
+    if len(recent) == backfill_size():
+        extend_horizon(follower_id, recent[-1][1])
+
+
+def follow_removed(follower_id, following_id):
+    TimelineEntry.objects.filter(user_id=follower_id, author_id=following_id).delete()
+    cache.delete(f'timeline:high-fanout:{follower_id}')
+
+
+def rebuild_timeline(user):
+    """Recreate a user's timeline from scratch (used by backfill_timelines)"""
+    skipped = set(high_fanout_following(user))
+    author_ids = [
+        author_id
+        for author_id in Follow.objects.filter(follower=user).values_list('following_id', flat=True)
+        if author_id not in skipped
+    ]
+    author_ids.append(user.pk)
+
+    recent = Post.objects.filter(
+        author_id__in=author_ids,
+        is_active=True
+    ).order_by('-created_at', '-id').values_list('id', 'author_id', 'created_at')[:backfill_size()]
+    recent = list(recent)
+    entries = [
+        TimelineEntry(user_id=user.pk, post_id=post_id, author_id=author_id, created_at=created_at)
+        for post_id, author_id, created_at in recent
+    ]
+
+    TimelineEntry.objects.filter(user=user).delete()
+    _bulk_insert(entries)
+    if len(entries) == backfill_size():
+        TimelineHorizon.objects.update_or_create(user_id=user.pk, defaults={'created_at': entries[-1].created_at})
+    else:
+        TimelineHorizon.objects.filter(user_id=user.pk).delete()
+    return len(entries)
+
+
+def _position(cursor):
+    values = decode_cursor(cursor, size=2)
+    if values is None:
+        return None
+    try:
+        return TimelineEntry._meta.get_field('created_at').to_python(values[0]), int(values[1])
+    except (ValidationError, TypeError, ValueError):
+        return None
+
+
+def _fetch_posts(keys):
+    """Load posts for (created_at, id) keys, preserving the key order"""
+    by_id = Post.objects.filter(
+        id__in=[pk for _, pk in keys],
+        is_active=True
+    ).select_related('author').in_bulk()
+    return [by_id[pk] for _, pk in keys if pk in by_id]
+
+
+def read_timeline(user, cursor=None, per_page=10):
+    """
+    Return one CursorPage of ``user``'s home feed.
+
+    Only ``per_page + 1`` rows are read from the timeline (plus the same from
+    high-fanout authors, if any are followed, and from the pull query past
+    the timeline's horizon), regardless of how deep the page is.
+    """
+    position = _position(cursor)
+    horizon = TimelineHorizon.objects.filter(user=user).values_list('created_at', flat=True).first()
+
+    entries = TimelineEntry.objects.filter(user=user)
+    if position:
+        entries = entries.filter(keyset_filter(('-created_at', '-post_id'), position))
+    if horizon is not None:
+        entries = entries.filter(created_at__gt=horizon)
+    keys = set(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:per_page + 1])
+
+    if horizon is not None and len(keys) <= per_page:
+        # The page reaches the part of the timeline that was not backfilled
+        author_ids = list(follow_graph.following_ids(user.pk))
+        author_ids.append(user.pk)
+        pulled = Post.objects.filter(author_id__in=author_ids, is_active=True, created_at__lte=horizon)
+        if position:
+            pulled = pulled.filter(keyset_filter(('-created_at', '-id'), position))
+        keys.update(pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:per_page + 1])
+
+    high_fanout = high_fanout_following(user)
+    if high_fanout:
+        merged = Post.objects.filter(author_id__in=high_fanout, is_active=True)
+        if position:
+            merged = merged.filter(keyset_filter(('-created_at', '-id'), position))
+        keys.update(merged.order_by('-created_at', '-id').values_list('created_at', 'id')[:per_page + 1])
+
+    keys = sorted(keys, reverse=True)
+    next_cursor = encode_cursor(keys[per_page - 1]) if len(keys) > per_page else None
+    return CursorPage(_fetch_posts(keys[:per_page]), next_cursor)
+
+
+def read_public_feed(cursor=None, per_page=10):
+    """Keyset-paged feed of all active posts, for anonymous visitors"""
+    posts = Post.objects.filter(is_active=True).select_related('author')
+    return CursorPaginator(posts, per_page).page(cursor)
@@ -0,0 +1,81 @@
+"""
+Time-decayed trending scores for the explore page.
+
+A post's trending value at time ``now`` is its weighted engagement decayed by
+``2 ** (-(now - created_at) / half_life)``. Because the decay factor is shared
+by every post, ordering by that value is the same as ordering by
+
+    log2(1 + engagement) + (created_at - EPOCH) / half_life
+
+which does not change as time passes. That is what gets stored in
+``Post.trending_score``, so it only has to be refreshed when a post's
+engagement changes (or when the weights/half-life settings change, via the
+recompute_trending command), and explore can read it straight off an index.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from posts.models import Post
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+DEFAULT_WEIGHTS = {
+    'likes': 1.0,
+    'comments': 2.0,
+    'saves': 2.0,
+    'shares': 3.0,
+}
+
+SCORE_FIELDS = ['created_at', 'likes_count', 'comments_count', 'saves_count', 'shares_count']
+
+
+def half_life_seconds():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'TRENDING_WEIGHTS', {})}
+
+
+def compute_score(post):
+    """Compute the stored trending score from a post's counters and age"""
+    w = weights()
+    engagement = (
+        w['likes'] * post.likes_count +
+        w['comments'] * post.comments_count +
+        w['saves'] * post.saves_count +
+        w['shares'] * post.shares_count
+    )
+    age_term = (post.created_at - EPOCH).total_seconds() / half_life_seconds()
+    return math.log2(1 + max(engagement, 0)) + age_term
+
+
+def refresh(post_id):
+    """Recompute one post's score after an engagement event"""
+    refresh_many([post_id])
+
+
+def refresh_many(post_ids):
+    """Recompute the scores of several posts with one SELECT and one bulk UPDATE"""
+    posts = list(Post.objects.filter(pk__in=set(post_ids)).only('pk', *SCORE_FIELDS))
+    for post in posts:
+        post.trending_score = compute_score(post)
+    Post.objects.bulk_update(posts, ['trending_score'])
+
+
+def recompute_all(batch_size=1000):
+    """Recompute every post's score in primary-key chunks; returns the number of posts"""
+    updated = 0
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *SCORE_FIELDS)[:batch_size])
+        if not posts:
+            break
+        last_pk = posts[-1].pk
+
+        for post in posts:
+            post.trending_score = compute_score(post)
+        Post.objects.bulk_update(posts, ['trending_score'])
+        updated += len(posts)
+    return updated
@@ -0,0 +1,86 @@
+"""
+Cached per-user unread counts for notifications and messages.
+
+Counts live in the ``UNREAD_COUNTS_CACHE`` cache alias (local memory by
+default; point it at a shared backend such as Redis or Memcached when running
+several processes, as core.checks requires once ``run_workers`` records
+notifications). They are incremented by the Notification/Message signal
+handlers in core.signals when a row is created, dropped when rows are marked
+read (``mark_read``), and recounted from the database on a miss, so polling
+the count endpoints normally touches no table at all. Both recounts and
+mark-read use the partial indexes on unread rows.
+
+Entries expire with the cache timeout, which bounds any drift from a count
+that raced with an increment.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Notification, Message
+
+NOTIFICATIONS = 'notifications'
+MESSAGES = 'messages'
+
+MODELS = {
+    NOTIFICATIONS: Notification,
+    MESSAGES: Message,
+}
+
+
+def _cache():
+    return caches[getattr(settings, 'UNREAD_COUNTS_CACHE', 'default')]
+
+
+def _key(kind, user_id):
+    return f'unread:{kind}:{user_id}'
+
+
+def get_counts(user_id):
+    """Return ``{'notifications': n, 'messages': m}``, counting only what the cache is missing"""
+    cache = _cache()
+    keys = {kind: _key(kind, user_id) for kind in MODELS}
+    cached = cache.get_many(keys.values())
+
+    counts = {}
+    missing = {}
+    for kind, key in keys.items():
+        if key in cached:
+            counts[kind] = cached[key]
+        else:
+            counts[kind] = MODELS[kind].objects.filter(recipient_id=user_id, is_read=False).count()
+            missing[key] = counts[kind]
+    if missing:
+        cache.set_many(missing)
+    return counts
+
+
+def etag(user_id):
+    counts = get_counts(user_id)
+    return f'{counts[NOTIFICATIONS]}-{counts[MESSAGES]}'
+
+
+def increment(user_id, kind):
+    try:
+        _cache().incr(_key(kind, user_id))
+    except ValueError:
+        # Not cached; the next read counts from the database
+        pass
+
+
+def mark_read(user_id, kind, up_to=None, **filters):
+    """
+    Mark ``user_id``'s unread rows of ``kind`` read, only those with an id up
+    to ``up_to`` when given (a high-water mark: everything the client has
+    seen). One UPDATE that touches unread rows only; returns how many.
+    """
+    rows = MODELS[kind].objects.filter(recipient_id=user_id, is_read=False, **filters)
+    if up_to is not None:
+        rows = rows.filter(id__lte=up_to)
+    marked = rows.update(is_read=True)
+    if marked:
+        invalidate(user_id, kind)
+    return marked
+
+
+def invalidate(user_id, kind):
+    _cache().delete(_key(kind, user_id))
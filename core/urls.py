@@ -11,5 +11,17 @@ urlpatterns = [
     path('messages/', views.messages, name='messages'),
     path('api/notification-count/', views.notification_count, name='notification_count'),
     path('api/message-count/', views.message_count, name='message_count'),
+    path('api/unread-counts/', views.unread_counts, name='unread_counts'),
     path('api/send-message/', views.send_message, name='send_message'),
+    path('api/notifications/read/', views.mark_notifications_read, name='mark_notifications_read'),
+    path('api/messages/read/', views.mark_messages_read, name='mark_messages_read'),
+    path('api/conversations/', views.inbox, name='inbox'),
+    path('api/conversations/<int:conversation_id>/messages/', views.conversation_messages, name='conversation_messages'),
+    path('api/events/', views.event_stream, name='event_stream'),
+    path('api/jobs/metrics/', views.job_metrics, name='job_metrics'),
+    path('api/reels/', views.reels_api, name='reels_api'),
+    path('api/stories/', views.story_tray, name='story_tray'),
+    path('api/stories/seen/', views.story_seen, name='story_seen'),
+    path('api/suggestions/', views.follow_suggestions, name='follow_suggestions'),
+    path('img/<str:token>/<slug:family>/<int:width>.<slug:fmt>', views.responsive_image, name='responsive_image'),
 ]
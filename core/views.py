@@ -1,102 +1,115 @@
+import posixpath
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import condition, require_POST, require_safe
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import get_user_model
 from posts.models import Post
 from posts.forms import PostForm
-from accounts.models import Follow
+from posts.serializers import serialize_post, serialize_reel
+from posts.viewer_state import annotate_viewer_state
+from posts.comments import attach_previews
 from .models import Notification, Message, Story
+from .pagination import CursorPaginator, page_response, wants_json
+from .serializers import (
+    serialize_conversation,
+    serialize_message,
+    serialize_notification,
+    serialize_story_group,
+    serialize_suggestion,
+)
+from . import conversations, images, jobs, realtime, recommendations, serving, stories, suggestions, timeline, unread
 
 User = get_user_model()
 
 
 def home(request):
+    cursor = request.GET.get('cursor')
     if request.user.is_authenticated:
-        # Get posts from users the current user follows + their own posts
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        posts = Post.objects.filter(
-            Q(author__in=following_users) | Q(author=request.user),
-            is_active=True
-        ).select_related('author').prefetch_related('likes', 'comments')
+        # Read one page of the materialized timeline (followed users + own posts)
+        page = timeline.read_timeline(request.user, cursor, per_page=10)
     else:
         # Show all posts for anonymous users
-        posts = Post.objects.filter(is_active=True).select_related('author').prefetch_related('likes', 'comments')
+        page = timeline.read_public_feed(cursor, per_page=10)
+    # Only the latest few comments of each post on the page, in one query
+    attach_previews(page.object_list)
 
-    # Add like and save status for each post
-    if request.user.is_authenticated:
-        for post in posts:
-            post.user_has_liked = post.is_liked_by(request.user)
-            post.user_has_saved = post.is_saved_by(request.user)
-    else:
-        for post in posts:
-            post.user_has_liked = False
-            post.user_has_saved = False
+    # Add like, save and follow status for the posts on this page
+    page.object_list = annotate_viewer_state(page.object_list, request.user)
 
-    # Pagination
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if wants_json(request):
+        return page_response(page, serialize_post)
 
-    # Post form for authenticated users
+    # Post form and story tray for authenticated users
     post_form = PostForm() if request.user.is_authenticated else None
+    story_tray = stories.tray(request.user) if request.user.is_authenticated else []
 
     context = {
-        'posts': page_obj,
+        'posts': page,
         'post_form': post_form,
+        'story_tray': story_tray,
     }
     return render(request, 'core/home.html', context)
 
 
-def reels(request):
-    # Filter for reel type posts (YouTube videos)
-    reels = Post.objects.filter(
-        post_type='reel',
-        is_active=True
-    ).select_related('author').prefetch_related('likes', 'comments').order_by('-created_at')
+def _reels_page(request, per_page):
+    # Reels ranked for this viewer from cached candidates and affinity (see core/recommendations.py)
+    page = recommendations.reel_page(request.user, request.GET.get('cursor'), per_page)
+
+    # Add like, save and follow status for each reel
+    page.object_list = annotate_viewer_state(page.object_list, request.user)
+    return page
 
-    # Add like and save status for each reel
-    if request.user.is_authenticated:
-        for reel in reels:
-            reel.user_has_liked = reel.is_liked_by(request.user)
-            reel.user_has_saved = reel.is_saved_by(request.user)
-    else:
-        for reel in reels:
-            reel.user_has_liked = False
-            reel.user_has_saved = False
 
-    # No pagination for YouTube Shorts-style experience
+def reels(request):
+    # Only the first few reels are rendered; the rest stream in from reels_api while scrolling
+    page = _reels_page(request, settings.REELS_FIRST_PAINT)
+
     context = {
-        'reels': reels,
+        'reels': page,
+        'prefetch_ahead': settings.REELS_PREFETCH_AHEAD,
     }
     return render(request, 'core/reels.html', context)
 
 
+def reels_api(request):
+    try:
+        per_page = min(int(request.GET.get('limit', settings.REELS_BATCH_SIZE)), 20)
+    except ValueError:
+        per_page = settings.REELS_BATCH_SIZE
+    page = _reels_page(request, max(per_page, 1))
+
+    # Tell the client how many reels before the end of this batch to request the next one
+    return page_response(
+        page,
+        lambda reel: serialize_reel(reel, request.user),
+        prefetch_ahead=settings.REELS_PREFETCH_AHEAD,
+    )
+
+
 def explore(request):
-    # Show trending/popular posts (ordered by likes and comments)
-    posts = Post.objects.filter(is_active=True).select_related('author').prefetch_related('likes', 'comments')
+    # Show trending posts, ordered by the stored time-decayed score (see core/trending.py)
+    posts = Post.objects.filter(is_active=True).select_related('author')
 
-    # Add like and save status for each post
-    if request.user.is_authenticated:
-        for post in posts:
-            post.user_has_liked = post.is_liked_by(request.user)
-            post.user_has_saved = post.is_saved_by(request.user)
-    else:
-        for post in posts:
-            post.user_has_liked = False
-            post.user_has_saved = False
+    # Pagination (keyset on the partial trending index)
+    paginator = CursorPaginator(posts, 12, ordering=('-trending_score', '-id'))
+    page = paginator.page(request.GET.get('cursor'))
 
-    # Simple trending algorithm - posts with most engagement
-    posts = sorted(posts, key=lambda x: x.likes_count + x.comments_count, reverse=True)
+    # Add like, save and follow status for the posts on this page
+    page.object_list = annotate_viewer_state(page.object_list, request.user)
 
-    # Pagination
-    paginator = Paginator(posts, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if wants_json(request):
+        return page_response(page, serialize_post)
 
     context = {
-        'posts': page_obj,
+        'posts': page,
     }
     return render(request, 'core/explore.html', context)
 
@@ -105,24 +118,52 @@ def explore(request):
 def notifications(request):
     notifications = Notification.objects.filter(recipient=request.user)
 
-    # Mark all as read when viewing
-    notifications.update(is_read=True)
+    # Mark all as read when opening the page, and update the badge in the user's other tabs
+    if not request.GET.get('cursor') and unread.mark_read(request.user.pk, unread.NOTIFICATIONS):
+        realtime.publish_counts(request.user.pk)
 
-    # Pagination
-    paginator = Paginator(notifications, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination; coalescing bumps updated_at, so later pages only show groups as of the first page
+    paginator = CursorPaginator(
+        notifications.select_related('sender', 'post'),
+        20,
+        ordering=('-updated_at', '-id'),
+        snapshot='updated_at',
+    )
+    page = paginator.page(request.GET.get('cursor'))
+
+    if wants_json(request):
+        return page_response(page, serialize_notification)
 
     context = {
-        'notifications': page_obj,
+        'notifications': page,
     }
     return render(request, 'core/notifications.html', context)
 
 
+def _unread_etag(request):
+    if request.user.is_authenticated:
+        return unread.etag(request.user.pk)
+    return None
+
+
+def _unread_response(data):
+    # Browsers revalidate with If-None-Match on every poll and get a 304 while counts are unchanged
+    response = JsonResponse(data)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
+@condition(etag_func=_unread_etag)
 def notification_count(request):
-    count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-    return JsonResponse({'count': count})
+    return _unread_response({'count': unread.get_counts(request.user.pk)[unread.NOTIFICATIONS]})
+
+
+@login_required
+@condition(etag_func=_unread_etag)
+def unread_counts(request):
+    # Both badges in one request (see core/unread.py)
+    return _unread_response(unread.get_counts(request.user.pk))
 
 
 @login_required
@@ -130,9 +171,9 @@ def messages(request):
     # Get all users with same credentials for demo chat
     demo_users = User.objects.filter(email='xyz@gmail.com').exclude(id=request.user.id)
 
-    # Get recent messages
+    # Get recent messages from the user's conversations (see core/conversations.py)
     messages = Message.objects.filter(
-        Q(sender=request.user) | Q(recipient=request.user)
+        conversation__in=request.user.conversation_memberships.values('conversation_id')
     ).select_related('sender', 'recipient')[:50]
 
     context = {
@@ -145,21 +186,19 @@ def messages(request):
 @login_required
 def send_message(request):
     if request.method == 'POST':
-        recipient_id = request.POST.get('recipient_id')
+        recipient_id = _posted_id(request, 'recipient_id')
         content = request.POST.get('content')
 
-        if recipient_id and content:
-            recipient = User.objects.get(id=recipient_id)
-            message = Message.objects.create(
-                sender=request.user,
-                recipient=recipient,
-                content=content
-            )
+        recipient = User.objects.filter(id=recipient_id).first() if recipient_id else None
+        if recipient and content:
+            # Also updates the conversation's last message and unread count
+            message = conversations.send(request.user, recipient, content)
 
             return JsonResponse({
                 'status': 'success',
                 'message': {
                     'id': message.id,
+                    'conversation_id': message.conversation_id,
                     'content': message.content,
                     'sender': message.sender.username,
                     'created_at': message.created_at.strftime('%H:%M')
@@ -170,6 +209,140 @@ def send_message(request):
 
 
 @login_required
+def inbox(request):
+    # Conversations by last activity, with unread counts (see core/conversations.py)
+    page = conversations.inbox_page(request.user, request.GET.get('cursor'))
+    return page_response(page, serialize_conversation)
+
+
+@login_required
+def conversation_messages(request, conversation_id):
+    member = conversations.membership(request.user, conversation_id)
+    if member is None:
+        raise Http404
+
+    page = conversations.thread_page(member.conversation, request.GET.get('cursor'))
+
+    # Opening a thread reads it up to the newest message shown; update the badge in the user's other tabs
+    if page and conversations.mark_read(request.user, up_to=page[0].pk, conversation_id=member.conversation_id):
+        realtime.publish_counts(request.user.pk)
+    return page_response(page, serialize_message, conversation_id=member.conversation_id)
+
+
+def _posted_id(request, name):
+    # Optional positive integer id from the POST body; False when malformed
+    value = request.POST.get(name)
+    if value in (None, ''):
+        return None
+    return int(value) if value.isdigit() else False
+
+
+def _marked_response(request, marked):
+    if marked:
+        realtime.publish_counts(request.user.pk)
+    return JsonResponse({'marked': marked, 'counts': unread.get_counts(request.user.pk)})
+
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    # Everything up to notification id `up_to` (all when omitted) becomes read
+    up_to = _posted_id(request, 'up_to')
+    if up_to is False:
+        return JsonResponse({'error': 'up_to must be a notification id'}, status=400)
+    return _marked_response(request, unread.mark_read(request.user.pk, unread.NOTIFICATIONS, up_to))
+
+
+@login_required
+@require_POST
+def mark_messages_read(request):
+    # Messages up to id `up_to`, optionally in one conversation, become read
+    up_to = _posted_id(request, 'up_to')
+    conversation_id = _posted_id(request, 'conversation_id')
+    if up_to is False or conversation_id is False:
+        return JsonResponse({'error': 'up_to and conversation_id must be ids'}, status=400)
+    return _marked_response(request, conversations.mark_read(request.user, up_to, conversation_id))
+
+
+@login_required
+@condition(etag_func=_unread_etag)
 def message_count(request):
-    count = Message.objects.filter(recipient=request.user, is_read=False).count()
-    return JsonResponse({'count': count})
+    return _unread_response({'count': unread.get_counts(request.user.pk)[unread.MESSAGES]})
+
+
+@login_required
+def story_tray(request):
+    # Live stories of the viewer and everyone they follow, grouped by author (see core/stories.py)
+    return JsonResponse({'tray': [serialize_story_group(group) for group in stories.tray(request.user)]})
+
+
+@login_required
+def follow_suggestions(request):
+    # Precomputed "people you may know", one indexed read (see core/suggestions.py)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 30)
+    except ValueError:
+        limit = 10
+    return JsonResponse({
+        'results': [serialize_suggestion(s) for s in suggestions.for_user(request.user, limit)],
+    })
+
+
+@login_required
+@require_POST
+def story_seen(request):
+    story_id = request.POST.get('story_id')
+    if not story_id or not story_id.isdigit():
+        return JsonResponse({'error': 'story_id is required'}, status=400)
+    return JsonResponse({'success': stories.mark_seen(request.user, int(story_id))})
+
+
+@staff_member_required
+def job_metrics(request):
+    # Background job queue depth (see core/jobs.py), for monitoring
+    return JsonResponse(jobs.metrics())
+
+
+@login_required
+async def event_stream(request):
+    # Push channel for unread counts and new notifications/messages (see core/realtime.py)
+    if not isinstance(request, ASGIRequest):
+        # Holding a stream open needs the ASGI server; 204 tells EventSource
+        # not to reconnect, and the page falls back to polling the count APIs
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    response = StreamingHttpResponse(realtime.stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_safe
+def responsive_image(request, token, family, width, fmt):
+    # An upload resized for a srcset width, generated once and then served
+    # from the disk cache (see core/images.py)
+    try:
+        source = images.unsign_variant(token)
+    except signing.BadSignature:
+        raise Http404
+    if family not in images.FAMILIES or width not in images.FAMILIES[family][2] or fmt not in images.formats():
+        raise Http404
+
+    try:
+        path = images.variant(source, family, width, fmt)
+    except FileNotFoundError:
+        raise Http404
+    # The URL names the upload, not its content, so revalidate by content hash
+    etag = f'"{path.parent.name}-{path.stem}-{fmt}"'
+    return serving.file_response(request, path, content_type=f'image/{fmt}', etag=etag)
+
+
+@require_safe
+def media(request, path):
+    # Uploaded files, with range requests and proxy offload (see core/serving.py)
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, posixpath.normpath(path).lstrip('/'))
+    except SuspiciousFileOperation:
+        raise Http404
+    return serving.file_response(request, full_path)
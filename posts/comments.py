@@ -0,0 +1,204 @@
+"""
+Threaded comments for a post.
+
+``thread`` loads a page of a post's top-level comments (or of one comment's
+replies) together with their replies down to ``depth`` levels, in a number
+of queries that depends on ``depth`` and not on the size of the thread:
+
+* one keyset page of the roots, with their authors joined;
+* one query per reply level for the first ``replies_per_comment`` replies of
+  every comment on the level above, picked with ROW_NUMBER() partitioned by
+  parent, so a comment with thousands of replies still yields a few rows;
+* one query for which of the loaded comments the viewer has liked.
+
+The rows are linked into a tree in Python. Every comment carries
+``children`` (its loaded replies), ``user_has_liked`` and
+``more_replies``, set when it has replies that were not loaded. Those are
+fetched with ``thread(post, viewer, parent=comment.pk, cursor=...)``,
+starting after ``replies_cursor`` (None: from the first reply). Reply counts
+come from the ``replies_count`` counter column, never from COUNT().
+
+Every comment also has a materialized ``path``: the ids of its root, ...,
+its parent and itself, each zero-padded to ``PATH_STEP`` digits. Ids grow
+with creation time, so sorting a post's comments by path walks each thread
+depth first with replies oldest first, and a comment's whole subtree is the
+path range just after its own, one scan of ``posts_comment_path_idx``
+(post, path). ``subtree`` pages through it. ``place`` fills in the path when
+a comment is created and adds it to its ancestors' ``descendants_count``,
+so "View N replies" reads a column too. A path holds ``MAX_DEPTH`` levels;
+deeper replies attach to the deepest comment that fits (``reply_parent``).
+
+``attach_previews`` gives a page of feed posts their latest few comments
+with one ROW_NUMBER() query partitioned by post, over the partial
+``posts_comment_recent_idx`` (post, -created_at, -id) index, so the rows
+loaded depend on the page size and not on how many comments a post has.
+"""
+from django.conf import settings
+from django.db.models import F, Value, Window
+from django.db.models.functions import Concat, Greatest, RowNumber
+
+from core.pagination import CursorPaginator, encode_cursor
+from .models import Comment, CommentLike
+
+# Oldest first, as conversations are read
+ORDERING = ('created_at', 'id')
+
+PATH_STEP = 10
+MAX_DEPTH = Comment._meta.get_field('path').max_length // PATH_STEP
+
+
+def segment(comment_id):
+    return f'{comment_id:0{PATH_STEP}d}'
+
+
+def ancestor_ids(path):
+    """Ids of the comments above the one with ``path``, root first"""
+    return [int(path[i:i + PATH_STEP]) for i in range(0, len(path) - PATH_STEP, PATH_STEP)]
+
+
+def below(path):
+    """
+    Lookups for every path that extends ``path``: a string, or an expression
+    such as ``OuterRef('path')`` for a subquery
+    """
+    # ':' sorts right after '9'
+    upper = path + ':' if isinstance(path, str) else Concat(path, Value(':'))
+    return {'path__gt': path, 'path__lt': upper}
+
+
+def descendants(comment):
+    """``comment``'s replies at every depth, as one range over its path"""
+    return Comment.objects.filter(post_id=comment.post_id, **below(comment.path))
+
+
+def reply_parent(parent):
+    """The comment a reply to ``parent`` attaches to, keeping paths within MAX_DEPTH"""
+    if parent is None or parent.depth < MAX_DEPTH - 1:
+        return parent
+    return Comment.objects.get(pk=ancestor_ids(parent.path)[MAX_DEPTH - 2])
+
+
+def count_in_ancestors(comment, delta):
+    """Add ``delta`` to the descendant count of every comment above ``comment``"""
+    ids = ancestor_ids(comment.path)
+    if ids:
+        Comment.objects.filter(pk__in=ids).update(
+            descendants_count=Greatest(F('descendants_count') + delta, Value(0))
+        )
+
+
+def place(comment):
+    """Set a newly created comment's path and depth, and count it in its ancestors"""
+    prefix = comment.parent.path if comment.parent_id else ''
+    comment.path = prefix + segment(comment.pk)
+    comment.depth = len(prefix) // PATH_STEP
+    Comment.objects.filter(pk=comment.pk).update(path=comment.path, depth=comment.depth)
+    if comment.is_active:
+        count_in_ancestors(comment, 1)
+
+
+def _comments(post):
+    return Comment.objects.filter(post=post, is_active=True).select_related('author')
+
+
+def _first_replies(post, parent_ids, limit):
+    """The first ``limit`` replies of each of ``parent_ids``, in one query"""
+    ranked = _comments(post).filter(parent_id__in=parent_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('parent_id'),
+            order_by=[F(name).asc() for name in ORDERING],
+        )
+    )
+    return list(ranked.filter(position__lte=limit).order_by('parent_id', *ORDERING))
+
+
+def annotate_likes(comments, user):
+    """Set ``user_has_liked`` on ``comments`` with one query"""
+    liked = set()
+    if comments and user.is_authenticated:
+        liked = set(
+            CommentLike.objects.filter(
+                user=user,
+                comment_id__in=[comment.pk for comment in comments],
+            ).values_list('comment_id', flat=True)
+        )
+    for comment in comments:
+        comment.user_has_liked = comment.pk in liked
+
+
+def thread(post, viewer, parent=None, cursor=None, per_page=20, depth=2, replies_per_comment=3):
+    """
+    A CursorPage of ``post``'s top-level comments, or of the replies to the
+    comment with id ``parent``, each with up to ``replies_per_comment``
+    replies loaded per comment for ``depth - 1`` further levels.
+    """
+    roots = _comments(post).filter(parent_id=parent)
+    page = CursorPaginator(roots, per_page, ordering=ORDERING).page(cursor)
+
+    loaded = list(page)
+    level = loaded
+    for _ in range(depth - 1):
+        if not level:
+            break
+        by_parent = {comment.pk: comment for comment in level}
+        for comment in level:
+            comment.children = []
+        level = _first_replies(post, list(by_parent), replies_per_comment)
+        for reply in level:
+            by_parent[reply.parent_id].children.append(reply)
+        loaded.extend(level)
+
+    for comment in loaded:
+        children = getattr(comment, 'children', None)
+        if children is None:
+            # Below the depth limit: nothing loaded, the client asks from the start
+            comment.children = []
+            comment.more_replies = comment.replies_count > 0
+            comment.replies_cursor = None
+        else:
+            comment.more_replies = comment.replies_count > len(children)
+            comment.replies_cursor = (
+                encode_cursor([children[-1].created_at, children[-1].pk])
+                if comment.more_replies and children else None
+            )
+
+    annotate_likes(loaded, viewer)
+    return page
+
+
+def subtree(root, viewer, cursor=None, per_page=50):
+    """
+    A CursorPage of every active reply under ``root`` in thread order
+    (depth first), keyset-paginated on the path itself.
+    """
+    rows = descendants(root).filter(is_active=True).select_related('author')
+    page = CursorPaginator(rows, per_page, ordering=('path',)).page(cursor)
+    annotate_likes(page.object_list, viewer)
+    return page
+
+
+def attach_previews(posts, limit=None):
+    """
+    Set ``preview_comments`` on each of ``posts``: its latest ``limit``
+    active comments (FEED_PREVIEW_COMMENTS by default), oldest first, with
+    their authors, all from one query.
+    """
+    limit = limit if limit is not None else getattr(settings, 'FEED_PREVIEW_COMMENTS', 3)
+    posts = list(posts)
+    previews = {post.pk: [] for post in posts}
+    if previews and limit > 0:
+        ranked = Comment.objects.filter(post_id__in=list(previews), is_active=True).select_related(
+            'author'
+        ).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F('post_id'),
+                order_by=[F('created_at').desc(), F('id').desc()],
+            )
+        )
+        for comment in ranked.filter(position__lte=limit).order_by('post_id', *ORDERING):
+            previews[comment.post_id].append(comment)
+    for post in posts:
+        post.preview_comments = previews[post.pk]
+    return posts
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, fk, **filters):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}, **filters).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    Comment = apps.get_model('posts', 'Comment')
+    Save = apps.get_model('posts', 'Save')
+    Share = apps.get_model('posts', 'Share')
+    Post.objects.update(
+        likes_count=_count(Like, 'post'),
+        comments_count=_count(Comment, 'post'),
+        saves_count=_count(Save, 'post'),
+        shares_count=_count(Share, 'post'),
+    )
+    Comment.objects.update(replies_count=_count(Comment, 'parent', is_active=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_youtube_video_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='saves_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='shares_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_scores(apps, schema_editor):
+    from core.trending import compute_score
+
+    Post = apps.get_model('posts', 'Post')
+    posts = list(Post.objects.only('created_at', 'likes_count', 'comments_count', 'saves_count', 'shares_count'))
+    for post in posts:
+        post.trending_score = compute_score(post)
+    Post.objects.bulk_update(posts, ['trending_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_engagement_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-trending_score', '-id'], name='posts_trending_idx'),
+        ),
+        migrations.RunPython(populate_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+PATH_STEP = 10
+
+
+def populate_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    post_ids = Comment.objects.order_by().values_list('post_id', flat=True).distinct()
+    for post_id in post_ids.iterator():
+        # Parents are always created, and so numbered, before their replies
+        comments = list(Comment.objects.filter(post_id=post_id).order_by('id'))
+        by_id = {comment.pk: comment for comment in comments}
+        for comment in comments:
+            parent = by_id.get(comment.parent_id)
+            prefix = parent.path if parent else ''
+            comment.path = prefix + f'{comment.pk:0{PATH_STEP}d}'
+            comment.depth = len(prefix) // PATH_STEP
+            comment.descendants_count = 0
+        for comment in comments:
+            if not comment.is_active:
+                continue
+            ancestor = by_id.get(comment.parent_id)
+            while ancestor is not None:
+                ancestor.descendants_count += 1
+                ancestor = by_id.get(ancestor.parent_id)
+        Comment.objects.bulk_update(comments, ['path', 'depth', 'descendants_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_video_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='descendants_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='posts_comment_path_idx'),
+        ),
+    ]
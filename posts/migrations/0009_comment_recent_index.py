@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_comment_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['post', '-created_at', '-id'], name='posts_comment_recent_idx'),
+        ),
+    ]
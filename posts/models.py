@@ -1,8 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from PIL import Image
 import os
 import re
+import uuid
 
 User = get_user_model()
 
@@ -26,30 +26,26 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Denormalized counters, kept in step by core.signals and repaired by reconcile_counters
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    saves_count = models.PositiveIntegerField(default=0, editable=False)
+    shares_count = models.PositiveIntegerField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)  # See core/trending.py
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['-trending_score', '-id'],
+                condition=models.Q(is_active=True),
+                name='posts_trending_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.author.username} - {self.post_type} - {self.created_at.strftime('%Y-%m-%d')}"
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        
-        if self.image:
-            img = Image.open(self.image.path)
-            if img.height > 800 or img.width > 800:
-                output_size = (800, 800)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
-
-    @property
-    def likes_count(self):
-        return self.likes.count()
-
-    @property
-    def comments_count(self):
-        return self.comments.count()
-
     def is_liked_by(self, user):
         if user.is_authenticated:
             return self.likes.filter(user=user).exists()
@@ -60,14 +56,6 @@ class Post(models.Model):
             return self.saves.filter(user=user).exists()
         return False
 
-    @property
-    def saves_count(self):
-        return self.saves.count()
-
-    @property
-    def shares_count(self):
-        return self.shares.count()
-
     @staticmethod
     def extract_youtube_id(url):
         """Extract YouTube video ID from various YouTube URL formats"""
@@ -126,17 +114,29 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    replies_count = models.PositiveIntegerField(default=0, editable=False)  # Active direct replies
+    # Materialized path: the zero-padded ids of the root, ..., the parent and the comment itself
+    # (see posts/comments.py), so a thread in path order is a depth-first walk
+    path = models.CharField(max_length=255, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    descendants_count = models.PositiveIntegerField(default=0, editable=False)  # Active replies at any depth
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Subtree range scans: post = ? AND path > ? AND path < ? ORDER BY path
+            models.Index(fields=['post', 'path'], name='posts_comment_path_idx'),
+            # Latest comments per post, for feed previews
+            models.Index(
+                fields=['post', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='posts_comment_recent_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.author.username} - {self.content[:50]}"
 
-    @property
-    def replies_count(self):
-        return self.replies.filter(is_active=True).count()
-
 
 class CommentLike(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comment_likes')
@@ -182,3 +182,27 @@ class Share(models.Model):
 
     def __str__(self):
         return f"{self.user.username} shared {self.post.id} via {self.share_type}"
+
+
+class VideoUpload(models.Model):
+    """A chunked, resumable video upload (see posts/uploads.py)."""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()  # Declared by the client at init
+    received = models.PositiveBigIntegerField(default=0)  # Bytes on disk so far; the next chunk's offset
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} by {self.user.username} ({self.received}/{self.size})"
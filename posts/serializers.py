@@ -0,0 +1,75 @@
+from django.urls import reverse
+from django.utils.timesince import timesince
+from core.images import rendition_url
+
+
+def serialize_author(user):
+    return {
+        'username': user.username,
+        'full_name': user.get_full_name(),
+        'profile_picture': rendition_url(user.profile_picture, 'avatar_40'),
+        'is_verified': user.is_verified,
+    }
+
+
+def serialize_post(post):
+    """JSON shape of a post for infinite-scroll listings"""
+    return {
+        'id': post.id,
+        'url': reverse('posts:detail', args=[post.id]),
+        'author': serialize_author(post.author),
+        'post_type': post.post_type,
+        'content': post.content,
+        'caption': post.caption,
+        'image': rendition_url(post.image, 'feed'),
+        'video': post.video.url if post.video else None,
+        'youtube_video_id': post.youtube_video_id,
+        'likes_count': post.likes_count,
+        'comments_count': post.comments_count,
+        'saves_count': post.saves_count,
+        'shares_count': post.shares_count,
+        'user_has_liked': getattr(post, 'user_has_liked', False),
+        'user_has_saved': getattr(post, 'user_has_saved', False),
+        'user_follows_author': getattr(post, 'user_follows_author', False),
+        'created_at': post.created_at.isoformat(),
+    }
+
+
+def serialize_reel(reel, viewer):
+    """Only the fields reels.html needs to render a reel"""
+    return {
+        'id': reel.id,
+        'youtube_video_id': reel.youtube_video_id,
+        'video': reel.video.url if reel.video else None,
+        'image': rendition_url(reel.image, 'feed'),
+        'author': serialize_author(reel.author),
+        'is_own': viewer.is_authenticated and reel.author_id == viewer.pk,
+        'caption': reel.caption,
+        'content': reel.content,
+        'timesince': timesince(reel.created_at),
+        'likes_count': reel.likes_count,
+        'comments_count': reel.comments_count,
+        'shares_count': reel.shares_count,
+        'user_has_liked': getattr(reel, 'user_has_liked', False),
+        'user_has_saved': getattr(reel, 'user_has_saved', False),
+        'user_follows_author': getattr(reel, 'user_follows_author', False),
+    }
+
+
+def serialize_comment(comment):
+    """JSON shape of a comment and its loaded replies (see posts/comments.py)"""
+    return {
+        'id': comment.id,
+        'parent_id': comment.parent_id,
+        'author': serialize_author(comment.author),
+        'content': comment.content,
+        'created_at': comment.created_at.isoformat(),
+        'timesince': timesince(comment.created_at),
+        'depth': comment.depth,
+        'replies_count': comment.replies_count,
+        'descendants_count': comment.descendants_count,
+        'user_has_liked': getattr(comment, 'user_has_liked', False),
+        'replies': [serialize_comment(reply) for reply in getattr(comment, 'children', [])],
+        'more_replies': getattr(comment, 'more_replies', False),
+        'replies_cursor': getattr(comment, 'replies_cursor', None),
+    }
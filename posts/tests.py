@@ -0,0 +1,142 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Follow
+from .models import Comment, Like, Post, Save, Share
+
+User = get_user_model()
+
+
+class ViewerStateQueryCountTests(TestCase):
+    """
+    Pages of posts load their per-viewer state (see posts/viewer_state.py)
+    and related rows with a fixed number of queries, however many posts or
+    comments are on the page.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='pw')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}', email=f'author{i}@example.com', password='pw')
+            for i in range(2)
+        ]
+        cls.commenter = User.objects.create_user(username='commenter', email='commenter@example.com', password='pw')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for author in self.authors:
+                Follow.objects.create(follower=self.viewer, following=author)
+        self.client.force_login(self.viewer)
+
+    def add_posts(self, count, post_type='text'):
+        """Posts alternating between the authors, each with engagement from the viewer and others"""
+        posts = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                post = Post.objects.create(
+                    author=self.authors[i % len(self.authors)],
+                    content=f'sunset number {Post.objects.count()} #travel',
+                    post_type=post_type,
+                )
+                Like.objects.create(user=self.viewer, post=post)
+                if i % 2:
+                    Save.objects.create(user=self.viewer, post=post)
+                    Share.objects.create(user=self.viewer, post=post)
+                comment = Comment.objects.create(post=post, author=self.commenter, content='Nice')
+                Comment.objects.create(post=post, author=self.authors[0], content='Thanks', parent=comment)
+                posts.append(post)
+        return posts
+
+    def add_comments(self, post, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                comment = Comment.objects.create(post=post, author=self.commenter, content='Great shot')
+                for author in self.authors:
+                    Comment.objects.create(post=post, author=author, content='Agreed', parent=comment)
+
+    def get(self, url):
+        # Every request starts cold, so cached follow lists and rankings do not hide queries
+        for cache in caches.all():
+            cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertConstantQueries(self, url, grow, items):
+        """
+        ``url`` runs as many queries after ``grow()`` puts more on the page
+        as before; ``items(response)`` counts what the page shows.
+        """
+        with CaptureQueriesContext(connection) as before:
+            response = self.get(url)
+        shown = items(response)
+        self.assertGreater(shown, 0)
+
+        grow()
+        with self.assertNumQueries(len(before.captured_queries)):
+            response = self.get(url)
+        self.assertGreater(items(response), shown)
+
+    def test_home(self):
+        self.add_posts(2)
+        self.assertConstantQueries(
+            reverse('core:home'),
+            lambda: self.add_posts(6),
+            lambda response: len(response.context['posts'].object_list),
+        )
+
+    def test_explore(self):
+        self.add_posts(2)
+        self.assertConstantQueries(
+            reverse('core:explore'),
+            lambda: self.add_posts(6),
+            lambda response: len(response.context['posts'].object_list),
+        )
+
+    # Reel pages stay within the viewer's ranking; a page that runs past its
+    # end takes one more query for the reels after it
+
+    def test_reels(self):
+        self.add_posts(1, post_type='reel')
+        self.assertConstantQueries(
+            reverse('core:reels'),
+            lambda: self.add_posts(2, post_type='reel'),
+            lambda response: len(response.context['reels'].object_list),
+        )
+
+    def test_reels_api(self):
+        self.add_posts(2, post_type='reel')
+        self.assertConstantQueries(
+            reverse('core:reels_api') + '?limit=20',
+            lambda: self.add_posts(6, post_type='reel'),
+            lambda response: len(response.json()['results']),
+        )
+
+    def test_search_posts(self):
+        self.add_posts(2)
+        self.assertConstantQueries(
+            reverse('posts:search') + '?q=sunset',
+            lambda: self.add_posts(6),
+            lambda response: len(response.context['posts'].object_list),
+        )
+
+    def test_profile(self):
+        self.add_posts(2)
+        self.assertConstantQueries(
+            reverse('accounts:profile', args=[self.authors[0].username]),
+            lambda: self.add_posts(6),
+            lambda response: len(response.context['posts'].object_list),
+        )
+
+    def test_post_detail(self):
+        post = self.add_posts(1)[0]
+        self.assertConstantQueries(
+            reverse('posts:detail', args=[post.pk]),
+            lambda: self.add_comments(post, 5),
+            lambda response: len(response.context['comments'].object_list),
+        )
@@ -0,0 +1,200 @@
+"""
+Chunked, resumable video uploads.
+
+Instead of sending a whole video in one multipart request, the create post
+page:
+
+1. starts an upload with the file's name, size and type (``start``);
+2. sends the file in chunks, each as the raw body of a request carrying its
+   byte offset (``append``). After a failure it asks for the upload's
+   ``received`` count and resumes from there;
+3. finishes the upload once every byte is in (``complete``);
+4. submits the post form with ``video_upload=<id>`` instead of the file;
+   ``staged_file`` hands the assembled file to the form (see create_post).
+
+Chunks are streamed from the request into a staging file under
+``VIDEO_UPLOAD_DIR`` in small reads, so memory use does not depend on the
+chunk or video size. The directory is outside MEDIA_ROOT so partial files
+are never served. Size, chunk length and the file signature (with the first
+chunk) are checked as bytes arrive. On the filesystem storage the assembled
+file is moved into place rather than copied.
+
+Uploads left unfinished for ``VIDEO_UPLOAD_EXPIRY_HOURS`` are removed by
+``manage.py purge_uploads``.
+"""
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import VideoUpload
+
+# Accepted types -> file extensions
+VIDEO_TYPES = {
+    'video/mp4': ('.mp4', '.m4v'),
+    'video/quicktime': ('.mov',),
+    'video/webm': ('.webm',),
+}
+
+# Bytes needed from the start of a file to recognise it
+SIGNATURE_LENGTH = 12
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_bytes():
+    return getattr(settings, 'VIDEO_UPLOAD_MAX_BYTES', 500 * 1024 * 1024)
+
+
+def chunk_bytes():
+    return getattr(settings, 'VIDEO_UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024)
+
+
+def expiry():
+    return timedelta(hours=getattr(settings, 'VIDEO_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def staging_path(upload):
+    return Path(getattr(settings, 'VIDEO_UPLOAD_DIR', Path(settings.BASE_DIR) / 'uploads')) / f'{upload.pk}.part'
+
+
+def looks_like_video(head, content_type):
+    """Whether the first bytes of a file match its declared type"""
+    if content_type == 'video/webm':
+        # EBML header
+        return head[:4] == b'\x1aE\xdf\xa3'
+    # MP4 and QuickTime are ISO base media files, starting with a box such as ftyp
+    return head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free')
+
+
+def start(user, filename, size, content_type):
+    """Validate an upload's declared file and create its empty staging file"""
+    filename = get_valid_filename(os.path.basename(filename or ''))[-100:]
+    extensions = VIDEO_TYPES.get(content_type)
+    if not filename or extensions is None or not filename.lower().endswith(extensions):
+        raise UploadError('Only MP4, MOV and WebM videos can be uploaded', status=415)
+    if size <= 0:
+        raise UploadError('The video is empty')
+    if size > max_bytes():
+        raise UploadError(f'Videos can be at most {max_bytes() // (1024 * 1024)} MB', status=413)
+
+    upload = VideoUpload.objects.create(user=user, filename=filename, content_type=content_type, size=size)
+    path = staging_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return upload
+
+
+def get(user, upload_id):
+    upload = VideoUpload.objects.filter(pk=upload_id, user=user).first()
+    if upload is None:
+        raise UploadError('Upload not found', status=404)
+    return upload
+
+
+def append(upload, offset, length, stream):
+    """
+    Write ``length`` bytes read from ``stream`` at ``offset``, which must be
+    the number of bytes already received; returns the new count.
+    """
+    if upload.status != 'uploading':
+        raise UploadError('Upload already completed', status=409)
+    if offset != upload.received:
+        raise UploadError('Offset does not match the bytes received', status=409)
+    if length <= 0 or length > chunk_bytes():
+        raise UploadError(f'Chunks must be between 1 and {chunk_bytes()} bytes', status=413)
+    if offset + length > upload.size:
+        raise UploadError('Chunk goes past the declared size', status=413)
+    if offset == 0 and length < min(SIGNATURE_LENGTH, upload.size):
+        raise UploadError(f'The first chunk must hold at least {SIGNATURE_LENGTH} bytes')
+
+    # Claim the range first, so two requests for the same offset cannot both write
+    claimed = VideoUpload.objects.filter(pk=upload.pk, status='uploading', received=offset).update(
+        received=offset + length, updated_at=timezone.now()
+    )
+    if not claimed:
+        raise UploadError('Offset does not match the bytes received', status=409)
+
+    written = 0
+    try:
+        with open(staging_path(upload), 'r+b') as staged:
+            staged.seek(offset)
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    raise UploadError('Chunk ended early')
+                if offset == 0 and written == 0 and not looks_like_video(data, upload.content_type):
+                    raise UploadError('The file is not a valid video', status=415)
+                staged.write(data)
+                written += len(data)
+    except BaseException:
+        # Give the range back; the client resumes from the old offset
+        with open(staging_path(upload), 'r+b') as staged:
+            staged.truncate(offset)
+        VideoUpload.objects.filter(pk=upload.pk, received=offset + length).update(received=offset)
+        raise
+
+    upload.received = offset + length
+    return upload.received
+
+
+def complete(upload):
+    if upload.status == 'complete':
+        return upload
+    if upload.received != upload.size or staging_path(upload).stat().st_size != upload.size:
+        raise UploadError('Upload is missing bytes', status=409)
+    VideoUpload.objects.filter(pk=upload.pk).update(status='complete', updated_at=timezone.now())
+    upload.status = 'complete'
+    return upload
+
+
+def completed(user, upload_id):
+    """A finished upload of ``user``, or None"""
+    try:
+        return VideoUpload.objects.filter(pk=upload_id, user=user, status='complete').first()
+    except ValidationError:
+        # Not a UUID
+        return None
+
+
+class StagedFile(File):
+    """An assembled upload, usable wherever Django expects an uploaded file"""
+
+    def __init__(self, upload):
+        super().__init__(open(staging_path(upload), 'rb'), name=upload.filename)
+        self.upload = upload
+        self.content_type = upload.content_type
+        self.size = upload.size
+
+    def temporary_file_path(self):
+        # Lets FileSystemStorage move the file into MEDIA_ROOT instead of copying it
+        return str(staging_path(self.upload))
+
+
+def staged_file(upload):
+    return StagedFile(upload)
+
+
+def discard(upload):
+    """Delete an upload and whatever is left of its staging file"""
+    staging_path(upload).unlink(missing_ok=True)
+    upload.delete()
+
+
+def purge_abandoned():
+    """Remove uploads not touched for the expiry period; returns how many"""
+    stale = list(VideoUpload.objects.filter(updated_at__lt=timezone.now() - expiry()))
+    for upload in stale:
+        discard(upload)
+    return len(stale)
@@ -5,7 +5,12 @@ app_name = 'posts'
 
 urlpatterns = [
     path('create/', views.create_post, name='create'),
+    path('uploads/', views.start_upload, name='start_upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_status, name='upload_status'),
+    path('uploads/<uuid:upload_id>/append/', views.append_upload, name='append_upload'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_upload, name='complete_upload'),
     path('<int:post_id>/', views.post_detail, name='detail'),
+    path('<int:post_id>/comments/', views.post_comments, name='comments'),
     path('<int:post_id>/edit/', views.edit_post, name='edit'),
     path('like/', views.like_post, name='like'),
     path('save/', views.save_post, name='save'),
@@ -0,0 +1,37 @@
+from core import follow_graph
+from .models import Like, Save, Share
+
+
+def annotate_viewer_state(posts, user):
+    """
+    Set the per-viewer flags used by the post templates on a page of posts.
+
+    Adds ``user_has_liked``, ``user_has_saved``, ``user_has_shared`` and
+    ``user_follows_author`` to every post using one set-based query per
+    flag, instead of two EXISTS queries per post. Returns the posts as a list
+    so it can be assigned back to ``page.object_list``.
+    """
+    posts = list(posts)
+
+    if not posts or not user.is_authenticated:
+        for post in posts:
+            post.user_has_liked = False
+            post.user_has_saved = False
+            post.user_has_shared = False
+            post.user_follows_author = False
+        return posts
+
+    post_ids = [post.pk for post in posts]
+    liked = set(Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True))
+    saved = set(Save.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True))
+    shared = set(Share.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True))
+
+    # From the viewer's cached following list (see core/follow_graph.py)
+    following = follow_graph.following_state(user, {post.author_id for post in posts})
+
+    for post in posts:
+        post.user_has_liked = post.pk in liked
+        post.user_has_saved = post.pk in saved
+        post.user_has_shared = post.pk in shared
+        post.user_follows_author = post.author_id in following
+    return posts
@@ -2,34 +2,55 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.views.decorators.http import require_GET, require_POST
+from django.db import transaction
 from .models import Post, Like, Comment, CommentLike, Save, Share
 from .forms import PostForm, CommentForm
-from core.models import Notification
+from .serializers import serialize_comment, serialize_post
+from .viewer_state import annotate_viewer_state
+from . import comments as comment_threads, uploads
+from core import notifications, search
+from core.images import rendition_url
+from core.pagination import CursorPage, CursorPaginator, decode_cursor, encode_cursor, page_response, wants_json
 
 
 @login_required
 def create_post(request):
     if request.method == 'POST':
-        form = PostForm(request.POST, request.FILES)
-        if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-
-            # Handle YouTube URL for reels
-            if form.cleaned_data.get('youtube_video_id'):
-                post.youtube_video_id = form.cleaned_data['youtube_video_id']
-
-            post.save()
-            messages.success(request, 'Post created successfully!')
-
-            # Redirect to reels page if it's a reel
-            if post.post_type == 'reel':
-                messages.success(request, 'Reel created successfully! 🎬')
-                return redirect('core:reels')
-            return redirect('core:home')
+        files = request.FILES
+        # A video sent through the chunked upload API (see posts/uploads.py)
+        upload = uploads.completed(request.user, request.POST.get('video_upload'))
+        staged = None
+        if upload is not None and 'video' not in files:
+            files = files.copy()
+            files['video'] = staged = uploads.staged_file(upload)
+
+        try:
+            form = PostForm(request.POST, files)
+            if form.is_valid():
+                post = form.save(commit=False)
+                post.author = request.user
+
+                # Handle YouTube URL for reels
+                if form.cleaned_data.get('youtube_video_id'):
+                    post.youtube_video_id = form.cleaned_data['youtube_video_id']
+
+                post.save()
+                if upload is not None:
+                    if staged is not None:
+                        staged.close()
+                    uploads.discard(upload)
+                messages.success(request, 'Post created successfully!')
+
+                # Redirect to reels page if it's a reel
+                if post.post_type == 'reel':
+                    messages.success(request, 'Reel created successfully! 🎬')
+                    return redirect('core:reels')
+                return redirect('core:home')
+        finally:
+            # The staged file stays for another attempt when the form is invalid
+            if staged is not None:
+                staged.close()
     else:
         # Check if type parameter is provided (e.g., ?type=reel)
         initial_data = {}
@@ -44,16 +65,12 @@ def create_post(request):
 
 def post_detail(request, post_id):
     post = get_object_or_404(Post, id=post_id, is_active=True)
-    comments = Comment.objects.filter(post=post, is_active=True, parent=None)
+    # Comments, their first replies, authors and like state in a fixed number of queries
+    comments = comment_threads.thread(post, request.user, cursor=request.GET.get('cursor'))
     comment_form = CommentForm()
 
-    # Add like and save status for the post
-    if request.user.is_authenticated:
-        post.user_has_liked = post.is_liked_by(request.user)
-        post.user_has_saved = post.is_saved_by(request.user)
-    else:
-        post.user_has_liked = False
-        post.user_has_saved = False
+    # Add like, save and follow status for the post
+    annotate_viewer_state([post], request.user)
 
     context = {
         'post': post,
@@ -63,38 +80,57 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@require_GET
+def post_comments(request, post_id):
+    """
+    A page of a post's comments, or of one comment's replies (``parent``), as
+    a JSON tree; with ``root``, every reply under that comment in thread order.
+    """
+    post = get_object_or_404(Post, id=post_id, is_active=True)
+    cursor = request.GET.get('cursor')
+    root = request.GET.get('root')
+    if root is not None:
+        if not root.isdigit():
+            return JsonResponse({'error': 'Invalid root'}, status=400)
+        root = get_object_or_404(Comment, id=root, post=post, is_active=True)
+        page = comment_threads.subtree(root, request.user, cursor=cursor)
+        return page_response(page, serialize_comment, root_id=root.pk)
+
+    parent = request.GET.get('parent')
+    if parent is not None:
+        try:
+            parent = int(parent)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid parent'}, status=400)
+
+    page = comment_threads.thread(post, request.user, parent=parent, cursor=cursor)
+    return page_response(page, serialize_comment, parent_id=parent)
+
+
 @login_required
 @require_POST
 def like_post(request):
     post_id = request.POST.get('post_id')
     post = get_object_or_404(Post, id=post_id)
     
-    like, created = Like.objects.get_or_create(user=request.user, post=post)
+    with transaction.atomic():
+        like, created = Like.objects.get_or_create(user=request.user, post=post)
+        if not created:
+            like.delete()
+    post.refresh_from_db(fields=['likes_count'])
 
     if created:
         # Create notification for post author (if not liking own post)
         if post.author != request.user:
-            Notification.objects.create(
-                recipient=post.author,
-                sender=request.user,
-                notification_type='like',
-                message=f'{request.user.username} liked your post',
-                post=post
-            )
+            notifications.notify(post.author_id, request.user.pk, 'like', post_id=post.pk, at=like.created_at)
 
         return JsonResponse({
             'status': 'liked',
             'likes_count': post.likes_count
         })
     else:
-        like.delete()
-        # Remove notification if it exists
-        Notification.objects.filter(
-            recipient=post.author,
-            sender=request.user,
-            notification_type='like',
-            post=post
-        ).delete()
+        # Take the like back out of the notification that counted it
+        notifications.retract(post.author_id, request.user.pk, 'like', post_id=post.pk, at=like.created_at)
 
         return JsonResponse({
             'status': 'unliked',
@@ -113,23 +149,24 @@ def add_comment(request):
     
     if not content.strip():
         return JsonResponse({'error': 'Comment cannot be empty'}, status=400)
+
+    parent = None
+    if parent_id:
+        parent = get_object_or_404(Comment, id=parent_id, post=post, is_active=True)
     
-    comment = Comment.objects.create(
-        author=request.user,
-        post=post,
-        content=content,
-        parent_id=parent_id if parent_id else None
-    )
+    with transaction.atomic():
+        # The comment's path is built from its parent's when it is saved
+        comment = Comment.objects.create(
+            author=request.user,
+            post=post,
+            content=content,
+            parent=comment_threads.reply_parent(parent)
+        )
+    post.refresh_from_db(fields=['comments_count'])
 
     # Create notification for post author (if not commenting on own post)
     if post.author != request.user:
-        Notification.objects.create(
-            recipient=post.author,
-            sender=request.user,
-            notification_type='comment',
-            message=f'{request.user.username} commented on your post',
-            post=post
-        )
+        notifications.notify(post.author_id, request.user.pk, 'comment', post_id=post.pk, at=comment.created_at)
 
     return JsonResponse({
         'status': 'success',
@@ -137,9 +174,11 @@ def add_comment(request):
             'id': comment.id,
             'content': comment.content,
             'author': comment.author.username,
-            'author_profile_pic': comment.author.profile_picture.url if comment.author.profile_picture else None,
+            'author_profile_pic': rendition_url(comment.author.profile_picture, 'avatar_40'),
             'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M'),
-            'replies_count': comment.replies_count
+            'replies_count': comment.replies_count,
+            'parent_id': comment.parent_id,
+            'depth': comment.depth,
         },
         'comments_count': post.comments_count
     })
@@ -175,10 +214,14 @@ def save_post(request):
     post_id = request.POST.get('post_id')
     post = get_object_or_404(Post, id=post_id)
 
-    save, created = Save.objects.get_or_create(
-        user=request.user,
-        post=post
-    )
+    with transaction.atomic():
+        save, created = Save.objects.get_or_create(
+            user=request.user,
+            post=post
+        )
+        if not created:
+            save.delete()
+    post.refresh_from_db(fields=['saves_count'])
 
     if created:
         return JsonResponse({
@@ -186,7 +229,6 @@ def save_post(request):
             'saves_count': post.saves_count
         })
     else:
-        save.delete()
         return JsonResponse({
             'status': 'unsaved',
             'saves_count': post.saves_count
@@ -202,12 +244,14 @@ def share_post(request):
 
     post = get_object_or_404(Post, id=post_id)
 
-    share = Share.objects.create(
-        user=request.user,
-        post=post,
-        share_type=share_type,
-        shared_to=shared_to
-    )
+    with transaction.atomic():
+        share = Share.objects.create(
+            user=request.user,
+            post=post,
+            share_type=share_type,
+            shared_to=shared_to
+        )
+    post.refresh_from_db(fields=['shares_count'])
 
     return JsonResponse({
         'status': 'shared',
@@ -216,6 +260,75 @@ def share_post(request):
     })
 
 
+def _upload_response(upload):
+    return JsonResponse({
+        'id': str(upload.pk),
+        'status': upload.status,
+        'size': upload.size,
+        'received': upload.received,
+        'chunk_size': uploads.chunk_bytes(),
+    })
+
+
+@login_required
+@require_POST
+def start_upload(request):
+    # Start a chunked video upload (see posts/uploads.py)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Size is required'}, status=400)
+    try:
+        upload = uploads.start(
+            request.user, request.POST.get('filename'), size, request.POST.get('content_type', '')
+        )
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return _upload_response(upload)
+
+
+@login_required
+@require_GET
+def upload_status(request, upload_id):
+    # Where to resume an interrupted upload from
+    try:
+        upload = uploads.get(request.user, upload_id)
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return _upload_response(upload)
+
+
+@login_required
+@require_POST
+def append_upload(request, upload_id):
+    # The raw request body is the chunk; it is streamed to disk, never read into memory
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Offset and Content-Length are required'}, status=400)
+    try:
+        upload = uploads.get(request.user, upload_id)
+        uploads.append(upload, offset, length, request)
+    except uploads.UploadError as error:
+        response = JsonResponse({'error': str(error)}, status=error.status)
+        if error.status == 409:
+            upload = uploads.get(request.user, upload_id)
+            response['Upload-Offset'] = upload.received
+        return response
+    return _upload_response(upload)
+
+
+@login_required
+@require_POST
+def complete_upload(request, upload_id):
+    try:
+        upload = uploads.complete(uploads.get(request.user, upload_id))
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return _upload_response(upload)
+
+
 @login_required
 def edit_post(request, post_id):
     post = get_object_or_404(Post, id=post_id, author=request.user)
@@ -245,32 +358,33 @@ def delete_post(request):
 
 def search_posts(request):
     query = request.GET.get('q', '')
-    posts = Post.objects.filter(is_active=True)
+    cursor = request.GET.get('cursor')
+    per_page = 10
 
     if query:
-        posts = posts.filter(
-            Q(content__icontains=query) |
-            Q(author__username__icontains=query) |
-            Q(author__first_name__icontains=query) |
-            Q(author__last_name__icontains=query)
-        )
-
-    # Add like and save status for each post
-    if request.user.is_authenticated:
-        for post in posts:
-            post.user_has_liked = post.is_liked_by(request.user)
-            post.user_has_saved = post.is_saved_by(request.user)
+        # Ranked ids from the full-text index (see core/search.py), paged by (id, score) of the last hit
+        position = decode_cursor(cursor, size=2)
+        try:
+            position = (int(position[0]), float(position[1])) if position else None
+        except (TypeError, ValueError):
+            position = None
+        ranked = search.search_posts(query, limit=per_page + 1, after=position)
+        next_cursor = encode_cursor(ranked[per_page - 1]) if len(ranked) > per_page else None
+        post_ids = [post_id for post_id, _ in ranked[:per_page]]
+        posts_by_id = Post.objects.filter(id__in=post_ids, is_active=True).select_related('author').in_bulk()
+        page = CursorPage([posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id], next_cursor)
     else:
-        for post in posts:
-            post.user_has_liked = False
-            post.user_has_saved = False
+        posts = Post.objects.filter(is_active=True).select_related('author')
+        page = CursorPaginator(posts, per_page).page(cursor)
+
+    # Add like, save and follow status for the posts on this page
+    page.object_list = annotate_viewer_state(page.object_list, request.user)
 
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if wants_json(request):
+        return page_response(page, serialize_post, query=query)
 
     context = {
-        'posts': page_obj,
+        'posts': page,
         'query': query,
     }
     return render(request, 'posts/search_results.html', context)
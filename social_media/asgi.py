@@ -1,5 +1,8 @@
 """
 ASGI config for social_media project.
+
+Serve the site from this application (e.g. ``uvicorn social_media.asgi:application``)
+for the /api/events/ push stream; under WSGI pages fall back to polling.
 """
 
 import os
@@ -105,6 +105,14 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media is served through core.views.media (see core/serving.py). Set the
+# backend to 'nginx' (X-Accel-Redirect to an internal location aliased to
+# MEDIA_ROOT) or 'apache' (X-Sendfile) to let the front proxy send the files.
+SERVE_MEDIA = config('SERVE_MEDIA', default=True, cast=bool)
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_MAX_AGE = 86400
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -119,3 +127,120 @@ AUTH_USER_MODEL = 'accounts.User'
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'core:home'
 LOGOUT_REDIRECT_URL = 'core:home'
+
+# Home timeline (fan-out-on-write)
+TIMELINE_FANOUT_MAX_FOLLOWERS = 5000  # Authors above this are merged in at read time instead
+TIMELINE_BACKFILL_SIZE = 200  # Posts copied into a timeline on follow / rebuild
+TIMELINE_BATCH_SIZE = 1000
+
+# Explore trending score (see core/trending.py); run recompute_trending after changing these
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_WEIGHTS = {
+    'likes': 1.0,
+    'comments': 2.0,
+    'saves': 2.0,
+    'shares': 3.0,
+}
+
+# Full-text search (see core/search.py): 'auto' uses SQLite FTS5 when available, else 'python'
+SEARCH_BACKEND = 'auto'
+SEARCH_REFRESH_SECONDS = 5  # How stale the 'python' index may get with writes from other processes
+
+# Reels feed: reels rendered with the page, reels per /api/reels/ batch, and how
+# many reels before the end of the loaded batch the client requests the next one
+REELS_FIRST_PAINT = 3
+REELS_BATCH_SIZE = 5
+REELS_PREFETCH_AHEAD = 2
+
+# Reel ranking (see core/recommendations.py)
+REELS_CANDIDATE_POOL = 500  # Most recent reels considered for ranking
+REELS_RANKING_SIZE = 200  # Top-K kept per viewer; the feed goes on newest first after them
+REELS_RANKING_TTL = 300
+REELS_FRESHNESS_HALF_LIFE_HOURS = 48
+REELS_RANKING_WEIGHTS = {
+    'follow': 2.0,
+    'affinity': 1.0,
+    'popularity': 0.5,
+    'freshness': 1.5,
+    'seen': 3.0,
+}
+
+# "People you may know" (see core/suggestions.py); refreshed after follows and by
+# `manage.py refresh_suggestions`
+SUGGESTIONS_PER_USER = 30
+SUGGESTION_ENGAGEMENT_DAYS = 30
+SUGGESTION_WEIGHTS = {
+    'mutual': 1.0,  # Per person the user follows who follows the candidate
+    'engagement': 0.5,  # Per recent like, save or comment on the candidate's posts
+    'follows_you': 2.0,
+}
+
+# Likes/comments/follows on the same post within this window share one notification row
+NOTIFICATION_COALESCE_WINDOW_HOURS = 24
+
+# Image renditions (see core/images.py), best first; formats Pillow cannot encode are skipped
+IMAGE_RENDITION_FORMATS = ['webp', 'jpeg']
+
+# Stories (see core/stories.py); expired stories are swept by `manage.py expire_stories`
+STORY_LIFETIME_HOURS = 24
+
+# Latest comments shown under each post in the feed (see posts/comments.py)
+FEED_PREVIEW_COMMENTS = 3
+
+# Chunked video uploads (see posts/uploads.py); partial files are staged outside MEDIA_ROOT
+VIDEO_UPLOAD_DIR = BASE_DIR / 'uploads'
+VIDEO_UPLOAD_MAX_BYTES = 500 * 1024 * 1024
+VIDEO_UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+VIDEO_UPLOAD_EXPIRY_HOURS = 24
+
+# On-demand srcset variants, keyed by content hash; safe to clear at any time
+IMAGE_CACHE_ROOT = MEDIA_ROOT / 'cache'
+
+# Background jobs (see core/jobs.py), processed by `manage.py run_workers`. When
+# eager, jobs run in-process right after the request's transaction commits instead.
+JOBS_ALWAYS_EAGER = config('JOBS_ALWAYS_EAGER', default=DEBUG, cast=bool)
+JOBS_RETRY_BACKOFF_SECONDS = 5
+JOBS_LOCK_TIMEOUT_SECONDS = 300
+JOBS_RETENTION_HOURS = 24
+
+# Realtime push over Server-Sent Events (see core/realtime.py). The in-process
+# broker only reaches clients connected to the same server process, so events
+# published by run_workers go through the database broker when jobs are not eager.
+REALTIME_BROKER = config(
+    'REALTIME_BROKER',
+    default='core.realtime.InProcessBroker' if JOBS_ALWAYS_EAGER else 'core.realtime.DatabaseBroker',
+)
+REALTIME_KEEPALIVE_SECONDS = 25
+REALTIME_POLL_SECONDS = 1
+REALTIME_EVENT_RETENTION_SECONDS = 300
+
+# Caches. Unread notification/message counts (see core/unread.py) and the follow
+# graph (see core/follow_graph.py) use their own aliases; point them at a shared
+# backend (Redis, Memcached) when running several processes (check core.W001).
+# Without eager jobs, run_workers updates unread counts and reads the follow graph,
+# so both default to the database cache (create the tables with
+# `manage.py createcachetable`; check core.E001).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'unread': {
+        'BACKEND': (
+            'django.core.cache.backends.locmem.LocMemCache' if JOBS_ALWAYS_EAGER
+            else 'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': 'unread-counts' if JOBS_ALWAYS_EAGER else 'core_unread_cache',
+        'TIMEOUT': 300,
+    },
+    'follow-graph': {
+        'BACKEND': (
+            'django.core.cache.backends.locmem.LocMemCache' if JOBS_ALWAYS_EAGER
+            else 'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': 'follow-graph' if JOBS_ALWAYS_EAGER else 'core_follow_graph_cache',
+        'TIMEOUT': 300,
+    },
+}
+UNREAD_COUNTS_CACHE = 'unread'
+# Cached following/follower id lists (see core/follow_graph.py)
+FOLLOW_GRAPH_CACHE = 'follow-graph'
@@ -1,10 +1,13 @@
 """
 URL configuration for social_media project.
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,6 +16,11 @@ urlpatterns = [
     path('posts/', include('posts.urls')),
 ]
 
+if settings.SERVE_MEDIA:
+    # Range/ETag aware; with MEDIA_SENDFILE_BACKEND the front proxy sends the bytes (see core/serving.py)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media, name='media'),
+    ]
+
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -167,6 +167,84 @@ document.addEventListener('DOMContentLoaded', function() {
         return div;
     }
 
+    // People you may know
+    document.querySelectorAll('.suggestions-card').forEach(function(card) {
+        fetch(card.dataset.suggestionsUrl)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.results.length) return;
+            const list = card.querySelector('.suggestions-scroll');
+            data.results.forEach(suggestion => list.appendChild(createSuggestionElement(suggestion)));
+            card.style.display = '';
+        })
+        .catch(error => console.error('Error loading suggestions:', error));
+    });
+
+    function createSuggestionElement(suggestion) {
+        const item = document.createElement('div');
+        item.className = 'suggestion-item';
+
+        const link = document.createElement('a');
+        link.href = suggestion.url;
+        link.className = 'suggestion-link';
+        let avatar;
+        if (suggestion.profile_picture) {
+            avatar = document.createElement('img');
+            avatar.src = suggestion.profile_picture;
+            avatar.alt = suggestion.username;
+        } else {
+            avatar = document.createElement('div');
+            avatar.className = 'bg-secondary d-flex align-items-center justify-content-center text-white';
+            avatar.textContent = suggestion.username.charAt(0).toUpperCase();
+        }
+        avatar.classList.add('suggestion-avatar');
+        const name = document.createElement('div');
+        name.className = 'suggestion-name';
+        name.textContent = suggestion.username;
+        const reason = document.createElement('small');
+        reason.className = 'text-muted';
+        if (suggestion.follows_you) {
+            reason.textContent = 'Follows you';
+        } else if (suggestion.mutual_count) {
+            reason.textContent = `${suggestion.mutual_count} mutual`;
+        }
+        link.append(avatar, name, reason);
+
+        const button = document.createElement('button');
+        button.className = 'btn btn-sm btn-primary suggestion-follow-btn';
+        button.dataset.username = suggestion.username;
+        button.textContent = 'Follow';
+        item.append(link, button);
+        return item;
+    }
+
+    document.addEventListener('click', function(e) {
+        const btn = e.target.closest('.suggestion-follow-btn');
+        if (!btn) return;
+        btn.disabled = true;
+        fetch('/accounts/follow/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'X-CSRFToken': csrftoken,
+            },
+            body: `username=${encodeURIComponent(btn.dataset.username)}`
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'followed') {
+                btn.textContent = 'Following';
+                btn.classList.replace('btn-primary', 'btn-outline-secondary');
+            } else {
+                btn.disabled = false;
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            btn.disabled = false;
+        });
+    });
+
     // Infinite scroll for posts (optional enhancement)
     let loading = false;
     window.addEventListener('scroll', function() {